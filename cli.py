@@ -22,7 +22,7 @@ from tqdm.auto import tqdm
 from htools.cli import fire
 from htools.core import tolist, save, load
 from incendio.nlp import FillMaskTransform, GenerativeTransform, \
-    ParaphraseTransform
+    ParaphraseTransform, augment_text_df
 
 
 TRANSFORMS = {
@@ -33,20 +33,46 @@ TRANSFORMS = {
 
 
 def generate(source, dest, transforms, n=5, text_col='text', id_cols=(),
-             stack_transforms=False, nrows=None):
+             stack_transforms=False, nrows=None, chunksize=None,
+             batch_size=None, fmt='csv', cache=None, seed=None, workers=1,
+             threads=None):
+    """Generate augmented text and save it to `dest`. If chunksize is
+    provided, the source csv is processed in chunks and each chunk's output
+    is written to its own shard in the `dest` directory along with a
+    manifest. Rerunning the same command after a crash skips completed
+    shards. Passing in a cache path stores generated text in a SQLite
+    database so reruns on overlapping data only process new rows (sampling
+    transforms like fillmask also require a seed to be cached). Use
+    --workers to run the transform in multiple processes, each of which loads
+    its own copy of the model (--threads sets the number of torch/BLAS
+    threads per worker; by default, cores are split evenly).
+
+    Examples
+    --------
+    python cli.py generate data/raw.csv data/augmented --transforms fillmask \
+        --chunksize 10_000 --batch_size 64 --id_cols '[label]'
+    python cli.py generate data/raw.csv data/augmented.csv \
+        --transforms paraphrase --cache data/aug_cache.db
+    python cli.py generate data/raw.csv data/augmented --transforms fillmask \
+        --chunksize 10_000 --workers 16 --threads 4
+    """
     # Note: use list args like --id_cols '[col1, col2]'
     source, dest = Path(source), Path(dest)
 
     # TODO: starting with simple case of 1 transform. Worry about adding
     # flexibility later.
     # tfms = [TRANSFORMS[t] for t in tolist(transforms)]
-    transform = TRANSFORMS[transforms](n=n)
-    df = pd.read_csv(source, usecols=[text_col] + list(id_cols))
-    res = transform(df[text_col].tolist())
-    print(res)
-    # df_res = transform(df[text_col].tolist())
-    # df_res.ends().pprint()
-    # df_res.to_csv(dest, index=False)
+    # augment_text_df creates the transform (or each worker does when using
+    # multiple processes) so we only pass along the name.
+    res = augment_text_df(source, transforms, dest, n=n, text_col=text_col,
+                          id_cols=tolist(id_cols), nrows=nrows,
+                          chunksize=chunksize, batch_size=batch_size,
+                          fmt=fmt, cache=cache, seed=seed, n_workers=workers,
+                          n_threads=threads)
+    if chunksize:
+        print(f'Wrote {len(res)} shards to {dest}.')
+    else:
+        print(f'Wrote {len(res):,} rows to {dest}.')
 
 
 if __name__ == '__main__':
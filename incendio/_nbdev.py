@@ -5,6 +5,7 @@ __all__ = ["index", "modules", "custom_doc_links", "git_url"]
 index = {"BaseModel": "00_core.ipynb",
          "adam": "06_optimizers.ipynb",
          "handle_interrupt": "00_core.ipynb",
+         "CheckpointWriter": "00_core.ipynb",
          "Trainer": "00_core.ipynb",
          "PredictionExaminer": "00_core.ipynb",
          "DEVICE": "01_utils.ipynb",
@@ -35,6 +36,7 @@ index = {"BaseModel": "00_core.ipynb",
          "PerformanceThreshold": "02_callbacks.ipynb",
          "ModelCheckpoint": "02_callbacks.ipynb",
          "MetricHistory": "02_callbacks.ipynb",
+         "StepProfiler": "02_callbacks.ipynb",
          "S3Uploader": "02_callbacks.ipynb",
          "BotoS3Uploader": "02_callbacks.ipynb",
          "CometCallback": "02_callbacks.ipynb",
@@ -44,10 +46,15 @@ index = {"BaseModel": "00_core.ipynb",
          "SchedulerMixin": "02_callbacks.ipynb",
          "CosineLRScheduler": "02_callbacks.ipynb",
          "AdaptiveSawtoothScheduler": "02_callbacks.ipynb",
+         "accumulable": "03_metrics.ipynb",
          "percent_positive": "03_metrics.ipynb",
          "mean_soft_prediction": "03_metrics.ipynb",
          "std_soft_prediction": "03_metrics.ipynb",
          "batch_size": "03_metrics.ipynb",
+         "accuracy": "03_metrics.ipynb",
+         "precision": "03_metrics.ipynb",
+         "recall": "03_metrics.ipynb",
+         "MetricAccumulator": "03_metrics.ipynb",
          "GRelu": "04_layers.ipynb",
          "JRelu": "04_layers.ipynb",
          "Mish": "04_layers.ipynb",
@@ -67,6 +74,7 @@ index = {"BaseModel": "00_core.ipynb",
          "SkipConnection": "04_layers.ipynb",
          "trunc_normal_": "04_layers.ipynb",
          "InitializedEmbedding": "04_layers.ipynb",
+         "HashLookup": "04_layers.ipynb",
          "BloomEmbedding": "04_layers.ipynb",
          "AxialEncoding": "04_layers.ipynb",
          "MultiAxialEncoding": "04_layers.ipynb",
@@ -76,10 +84,13 @@ index = {"BaseModel": "00_core.ipynb",
          "SequentialWithActivations": "04_layers.ipynb",
          "tokenizer": "05_nlp.ipynb",
          "tokenize": "05_nlp.ipynb",
+         "tokenize_stream": "05_nlp.ipynb",
          "tokenize_many": "05_nlp.ipynb",
+         "load_text_vectors": "05_nlp.ipynb",
          "Vocabulary": "05_nlp.ipynb",
          "domain": "05_nlp.ipynb",
          "domains_from_google_search": "05_nlp.ipynb",
+         "IVFIndex": "05_nlp.ipynb",
          "Embeddings": "05_nlp.ipynb",
          "back_translate": "05_nlp.ipynb",
          "postprocess_embeddings": "05_nlp.ipynb",
@@ -89,15 +100,20 @@ index = {"BaseModel": "00_core.ipynb",
          "FillMaskTransform": "05_nlp.ipynb",
          "NLP_TRANSFORMS": "05_nlp.ipynb",
          "BacktranslateTransform": "05_nlp.ipynb",
+         "AugmentationCache": "05_nlp.ipynb",
+         "CachedTransform": "05_nlp.ipynb",
          "augment_text_df": "05_nlp.ipynb",
          "variable_lr_optimizer": "06_optimizers.ipynb",
          "update_optimizer": "06_optimizers.ipynb",
          "probabilistic_hash_item": "07_data.ipynb",
          "probabilistic_hash_tensor": "07_data.ipynb",
+         "vectorized_hash_tensor": "07_data.ipynb",
          "plot_images": "07_data.ipynb",
          "RandomTransform": "07_data.ipynb",
          "RandomPipeline": "07_data.ipynb",
          "dataloader_subset": "07_data.ipynb",
+         "DevicePrefetcher": "07_data.ipynb",
+         "LocalS3Client": "07_data.ipynb",
          "BotoUploader": "07_data.ipynb",
          "smooth_soft_labels": "08_losses.ipynb",
          "soft_label_cross_entropy_with_logits": "08_losses.ipynb",
@@ -1,13 +1,14 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: notebooks/02_callbacks.ipynb (unless otherwise specified).
 
 __all__ = ['TorchCallback', 'BasicConfig', 'StatsHandler', 'SubsetHandler', 'MetricPrinter', 'BatchMetricPrinter',
-           'EarlyStopper', 'PerformanceThreshold', 'ModelCheckpoint', 'MetricHistory', 'S3Uploader', 'BotoS3Uploader',
-           'CometCallback', 'CometGradientCallback', 'EC2Closer', 'ModelUnfreezer', 'SchedulerMixin',
+           'EarlyStopper', 'PerformanceThreshold', 'ModelCheckpoint', 'MetricHistory', 'StepProfiler', 'S3Uploader',
+           'BotoS3Uploader', 'CometCallback', 'CometGradientCallback', 'EC2Closer', 'ModelUnfreezer', 'SchedulerMixin',
            'CosineLRScheduler', 'AdaptiveSawtoothScheduler']
 
 
 # Cell
 import boto3
+from collections import defaultdict
 from collections.abc import Iterable
 from comet_ml import Experiment
 import matplotlib.pyplot as plt
@@ -17,15 +18,14 @@ import os
 import pandas as pd
 import requests
 from tabulate import tabulate
+import time
+import torch
 from tqdm.auto import tqdm
 import warnings
 
-try:
-    from accio.s3tool import S3tool
-except ImportError:
-    warnings.warn('Accio not available.')
 from htools import auto_repr, valuecheck, save, delegate
 from .data import BotoUploader, dataloader_subset
+from .metrics import MetricAccumulator
 from .optimizers import variable_lr_optimizer, update_optimizer
 from .utils import DEVICE, is_builtin
 
@@ -94,6 +94,9 @@ class BasicConfig(TorchCallback):
     def on_train_end(self, trainer, *args, **kwargs):
         trainer.logger.info('Training complete. Model in eval mode.')
         trainer.net.eval()
+        # Make sure checkpoints are on disk before other callbacks (e.g.
+        # uploaders) run.
+        trainer.wait_for_saves()
 
 
 # Cell
@@ -111,9 +114,14 @@ class StatsHandler(TorchCallback):
 
     def on_epoch_end(self, trainer, epoch, val_stats):
         """Computes (possibly weighted) averages of mini-batch stats
-        at the end of each epoch.
+        at the end of each epoch. This is the only time training stats are
+        pulled off the device (aside from MetricPrinter's progress bar).
         """
         for group in (trainer.stats, val_stats):
+            if isinstance(group, MetricAccumulator):
+                group.finalize()
+                continue
+            # Lists of batch stats, e.g. from a custom `validate` method.
             for k, v in group.items():
                 if k == 'batch_size': continue
                 group[k] = np.average(v, weights=group['batch_size'])
@@ -172,7 +180,8 @@ class MetricPrinter(TorchCallback):
             stats. The default of 1 means we'll update it every mini
             batch, which can be too fast to read if mini batches
             are processed quickly (e.g. if batch size is small and the
-            forward pass is fast).
+            forward pass is fast). Each update syncs with the device to
+            retrieve the metric so larger values also speed up training.
         order: int
         """
         self.pbar_metric = pbar_metric
@@ -187,7 +196,8 @@ class MetricPrinter(TorchCallback):
 
     def on_epoch_begin(self, trainer, epoch, val_stats):
         """Create progress bar."""
-        trainer.pbar = tqdm(trainer._dl_train_curr, leave=False)
+        trainer.pbar = tqdm(trainer._prefetch(trainer._dl_train_curr),
+                            leave=False)
 
     def on_epoch_end(self, trainer, epoch, val_stats):
         """Print stats and close progress bar."""
@@ -204,7 +214,7 @@ class MetricPrinter(TorchCallback):
         if sum_i % self.batch_freq != 0:
             return
         kwargs = {self.pbar_metric:
-                  format(trainer.stats[self.pbar_metric][-1], '.4f')}
+                  format(trainer.stats.last(self.pbar_metric), '.4f')}
         trainer.pbar.set_postfix(**kwargs)
 
 
@@ -227,10 +237,11 @@ class BatchMetricPrinter(TorchCallback):
         self.curr_prints = 0
 
     def on_batch_end(self, trainer, i, sum_i):
-        if sum_i % batch_freq:
+        if sum_i % self.batch_freq == 0:
             self.curr_prints += 1
             metric_str = "\n".join(
-                f'{k}={round(v[-1], 4)}' for k, v in trainer.stats.items()
+                f'{k}={round(v, 4)}'
+                for k, v in trainer.stats.last_batch().items()
             )
             trainer.logger.info(f'Batch {sum_i}\n: {metric_str}')
         if self.curr_prints >= self.n_prints:
@@ -345,7 +356,29 @@ class ModelCheckpoint(TorchCallback):
     @valuecheck
     def __init__(self, metric='loss', goal:('max', 'min')='min',
                  fname='trainer.pkl', metric_fname='best_val_metrics.json',
-                 order=25):
+                 blocking=False, delta=False, order=25):
+        """
+        Parameters
+        ----------
+        metric: str
+            Name of validation metric to monitor.
+        goal: str
+            One of ('max', 'min'). Whether higher or lower values of `metric`
+            are better.
+        fname: str
+            File name to save the trainer to (in trainer.out_dir).
+        metric_fname: str
+            File name to save the validation metrics of the best epoch to.
+        blocking: bool
+            If False, checkpoints are written from a background thread (see
+            Trainer.save) so training doesn't stall while the file is
+            written. Pending writes are flushed when training ends.
+        delta: bool
+            If True, save delta checkpoints that only contain tensors that
+            changed since the base snapshot (see Trainer.save). Useful when
+            most of the model is frozen.
+        order: int
+        """
         # Will use op like: self.op(new_val, current_best)
         if goal == 'min':
             self.init_metric = self.best_metric = float('inf')
@@ -358,6 +391,8 @@ class ModelCheckpoint(TorchCallback):
 
         self.fname = fname
         self.metric_fname = metric_fname
+        self.blocking = blocking
+        self.delta = delta
         self.order = order
         self.metric = metric
         self.metric_path = None
@@ -381,7 +416,8 @@ class ModelCheckpoint(TorchCallback):
                 f'Saving model. {self.metric.title()} improved from '
                 f'{self.best_metric:.4f} to {new_val:.4f}.'
             )
-            trainer.save(self.fname)
+            trainer.save(self.fname, blocking=self.blocking,
+                         delta=self.delta)
             save({k: round(v, 5) for k, v in val_stats.items()},
                  self.metric_path)
             self.best_metric = new_val
@@ -447,23 +483,209 @@ class MetricHistory(TorchCallback):
             plt.show()
 
 
+# Cell
+class StepProfiler(TorchCallback):
+    """Records wall clock time spent in each phase of the training loop so
+    we can tell whether a slow epoch is due to data loading, host to device
+    copies, the forward pass, the loss, the backward pass, the optimizer step,
+    or callbacks. Each phase is the time between two consecutive hooks, e.g.
+    'forward' is the time from `after_zero_grad` to `after_forward` and
+    'data' is the time spent waiting on the dataloader between batches.
+    At the end of each epoch, we log a table of percentiles to train.log and
+    append the same stats to a csv file in the trainer's output directory
+    so timings can be compared across runs.
+
+    Notes: when training on a GPU, we synchronize the device at every hook so
+    that asynchronous kernels are attributed to the right phase. This slows
+    training down a bit, which is why the profiler is opt-in. Timings are
+    most precise with accumulate_steps=1 and no micro batching: otherwise
+    the backward passes of all but the last micro batch in a step are counted
+    towards the next 'forward'. Time spent in other callbacks' hooks is
+    counted towards the next phase (so a low `order` is recommended).
+    """
+
+    # Maps hook to the phase that ends when it's called.
+    hook2phase = {'on_batch_begin': 'data',
+                  'after_zero_grad': 'to_device_zero_grad',
+                  'after_forward': 'forward',
+                  'after_loss': 'loss',
+                  'after_backward': 'backward',
+                  'after_step': 'optim_step',
+                  'on_batch_end': 'callbacks'}
+
+    def __init__(self, fname='profile.csv', percentiles=(50, 90, 99),
+                 enabled=True, order=-1):
+        """
+        Parameters
+        ----------
+        fname: str
+            Name of csv file to write results to (not a full path - it will
+            be placed in the trainer's `out_dir`). Results from each epoch
+            are appended as they come in, along with a `run` column (which
+            increments each time `fit` is called) so existing results from
+            previous runs are kept. Pass in None to skip this.
+        percentiles: Iterable[int]
+            Percentiles of per-batch time to report for each phase.
+        enabled: bool
+            Set this to False to turn the profiler off without removing it
+            from the trainer. When disabled, no device synchronization
+            occurs.
+        order: int
+            Determines order callbacks are executed in.
+        """
+        self.fname = fname
+        self.percentiles = list(percentiles)
+        self.enabled = enabled
+        self.order = order
+
+        # Set in `on_train_begin`.
+        self.path = None
+        self.run = None
+        self.cuda = False
+        self.times = defaultdict(list)
+        self.prev = None
+        self.df = None
+
+    def _mark(self, trainer, phase):
+        """Attribute time since the previous mark to `phase`."""
+        if self.cuda: torch.cuda.synchronize(trainer.device)
+        now = time.perf_counter()
+        if phase and self.prev is not None:
+            self.times[phase].append(now - self.prev)
+        self.prev = now
+
+    def on_train_begin(self, trainer, *args, **kwargs):
+        self.cuda = torch.device(trainer.device).type == 'cuda'
+        self.path = os.path.join(trainer.out_dir, self.fname) \
+            if self.fname else None
+        self.df = None
+        self.run = 0
+        if self.path and os.path.exists(self.path):
+            prev = pd.read_csv(self.path, usecols=['run'])
+            if not prev.empty: self.run = int(prev.run.max()) + 1
+
+    def on_epoch_begin(self, trainer, epoch, val_stats):
+        self.times.clear()
+        if self.enabled: self._mark(trainer, None)
+
+    def on_batch_begin(self, trainer, i, sum_i):
+        if self.enabled: self._mark(trainer, self.hook2phase['on_batch_begin'])
+
+    def after_zero_grad(self, trainer, i, sum_i, xb, yb):
+        if self.enabled:
+            self._mark(trainer, self.hook2phase['after_zero_grad'])
+
+    def after_forward(self, trainer, i, sum_i):
+        if self.enabled: self._mark(trainer, self.hook2phase['after_forward'])
+
+    def after_loss(self, trainer, i, sum_i):
+        if self.enabled: self._mark(trainer, self.hook2phase['after_loss'])
+
+    def after_backward(self, trainer, i, sum_i):
+        if self.enabled:
+            self._mark(trainer, self.hook2phase['after_backward'])
+
+    def after_step(self, trainer, i, sum_i):
+        if self.enabled: self._mark(trainer, self.hook2phase['after_step'])
+
+    def on_batch_end(self, trainer, i, sum_i):
+        if self.enabled: self._mark(trainer, self.hook2phase['on_batch_end'])
+
+    def on_epoch_end(self, trainer, epoch, val_stats):
+        if not self.enabled or not self.times: return
+        # Time since the last batch ended is mostly validation.
+        self._mark(trainer, 'validation')
+        df = self.summarize()
+        df.insert(0, 'run', self.run)
+        df.insert(1, 'epoch', epoch)
+        table = tabulate(df.drop(['run', 'epoch'], axis=1), headers='keys',
+                         tablefmt='github', floatfmt='.4f')
+        trainer.logger.info(f'\nStep times (seconds) in epoch {epoch}:\n\n'
+                            f'{table}\n')
+        self.df = pd.concat([self.df, df]) if self.df is not None else df
+        if self.path: self._write(df)
+
+    def _write(self, df):
+        """Append one epoch's results to the csv file. If previous runs used
+        different columns (e.g. different percentiles), the file is rewritten
+        with the union of both.
+        """
+        df = df.rename_axis('phase').reset_index()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                cols = f.readline().strip().split(',')
+            if cols != list(df.columns):
+                df = pd.concat([pd.read_csv(self.path), df])
+                df.to_csv(self.path, index=False)
+                return
+        df.to_csv(self.path, mode='a', index=False,
+                  header=not os.path.exists(self.path))
+
+    def summarize(self):
+        """Compute stats for each phase in the current epoch.
+
+        Returns
+        -------
+        pd.DataFrame: One row per phase (in the order they occur) with the
+        number of times the phase occurred, mean/total time, and the
+        requested percentiles. There's also a `pct_total` column showing the
+        share of total time spent in that phase.
+        """
+        phases = [p for p in [*self.hook2phase.values(), 'validation']
+                  if p in self.times]
+        rows = {}
+        for phase in phases:
+            times = np.array(self.times[phase])
+            rows[phase] = {'n': len(times), 'mean': times.mean(),
+                           **{f'p{p}': np.percentile(times, p)
+                              for p in self.percentiles},
+                           'total': times.sum()}
+        df = pd.DataFrame.from_dict(rows, orient='index')
+        df['pct_total'] = df.total / df.total.sum()
+        return df
+
+
 # Cell
 class S3Uploader(TorchCallback):
-    """Upload model and logs to S3 when training finishes."""
+    """Upload model and logs to S3 when training finishes. Files in the top
+    level of the output directory are uploaded to {prefix}/{file_name}.
+    """
 
-    def __init__(self, bucket, prefix, order=95):
-        """See Accio documentation for parameter details."""
+    def __init__(self, bucket, prefix, client=None, n_threads=16, order=95):
+        """
+        Parameters
+        ----------
+        bucket: str
+            Name of s3 bucket to upload to.
+        prefix: str
+            S3 "directory" to upload files to.
+        client: boto3 S3 client or None
+            Passed to BotoUploader (mostly useful for testing).
+        n_threads: int
+            Number of files to upload concurrently.
+        order: int
+        """
         self.bucket = bucket
         self.prefix = prefix
+        self.client = client
+        self.n_threads = n_threads
         self.order = order
 
     def on_train_end(self, trainer, *args, **kwargs):
-        """Upload files to s3 once training completes."""
+        """Upload files to s3 once training completes. Files that are
+        unchanged since the last upload are skipped (see BotoUploader).
+        """
         paths = [f.path for f in os.scandir(trainer.out_dir)
                  if f.is_file() and not f.name.startswith('.')]
-        s3 = S3tool()
+        s3 = BotoUploader(
+            self.bucket, verbose=False, client=self.client,
+            n_threads=self.n_threads,
+            manifest_path=os.path.join(trainer.out_dir, '.s3_manifest.json')
+        )
         try:
-            s3.upload_files(paths, self.bucket, self.prefix)
+            res = s3.upload_files(paths, self.prefix, retain_tree=False)
+            trainer.logger.info(f'Uploaded {len(res["uploaded"])} files to '
+                                f's3 ({len(res["skipped"])} unchanged).')
         except Exception as e:
             trainer.logger.error(e)
 
@@ -475,7 +697,8 @@ class BotoS3Uploader(TorchCallback):
     """
 
     def __init__(self, bucket, s3_dir='', retain_tree=True, recurse=True,
-                 keep_fn=None, order=95):
+                 keep_fn=None, verbose=True, client=None, n_threads=16,
+                 order=95):
         """
         Parameters
         ----------
@@ -496,22 +719,38 @@ class BotoS3Uploader(TorchCallback):
             If provided, this should be a function that accepts a filename as
             input and returns a boolean specifying whether to include it in the
             upload or not.
+        verbose: bool
+            If True, print a message for each uploaded or skipped file.
+        client: boto3 S3 client or None
+            Passed to BotoUploader (mostly useful for testing).
+        n_threads: int
+            Number of files to upload concurrently.
         """
         self.bucket = bucket
         self.s3_dir = s3_dir
         self.retain_tree = retain_tree
         self.recurse = recurse
         self.keep_fn = keep_fn
+        self.verbose = verbose
+        self.client = client
+        self.n_threads = n_threads
         self.order = order
 
     def on_train_end(self, trainer, *args, **kwargs):
-        """Upload files to s3 once training completes."""
-        paths = [f.path for f in os.scandir(trainer.out_dir)
-                 if f.is_file() and not f.name.startswith('.')]
-        s3 = BotoUploader(self.bucket, self.verbose)
+        """Upload files to s3 once training completes. Files that are
+        unchanged since the last upload are skipped (see BotoUploader).
+        """
+        s3 = BotoUploader(
+            self.bucket, self.verbose, client=self.client,
+            n_threads=self.n_threads,
+            manifest_path=os.path.join(trainer.out_dir, '.s3_manifest.json')
+        )
         try:
-            self.s3.upload_folder(trainer.out_dir, self.s3_dir,
-                                  self.retain_tree, self.recurse, self.keep_fn)
+            res = s3.upload_folder(trainer.out_dir, self.s3_dir,
+                                   self.retain_tree, self.recurse,
+                                   self.keep_fn)
+            trainer.logger.info(f'Uploaded {len(res["uploaded"])} files to '
+                                f's3 ({len(res["skipped"])} unchanged).')
         except Exception as e:
             trainer.logger.error(e)
 
@@ -789,7 +1028,7 @@ class CosineLRScheduler(SchedulerMixin):
         np.array: LR for each iteration (i.e. output[i] is the LR to use
             at iteration i).
         """
-        self.batches_per_e = len(trainer._dl_train_curr)
+        self.batches_per_e = trainer.steps_per_epoch()
         self.batches = epochs * self.batches_per_e
         self.max_lr = max(lrs) if isinstance(lrs, Iterable) else lrs
         self.lr_mult = lr_mult
@@ -907,10 +1146,8 @@ class AdaptiveSawtoothScheduler(SchedulerMixin):
 
     def on_batch_begin(self, trainer, i, sum_i):
         """Update LR at the start of every batch."""
-        try:
-            loss = trainer.stats.get('loss')[-1]
-        except:
-            return
+        loss = trainer.stats.last('loss')
+        if loss is None: return
 
         lr = max(p['lr'] for p in trainer.optim.param_groups)
         if loss <= self.recent_best:
@@ -1,13 +1,18 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: notebooks/00_core.ipynb (unless otherwise specified).
 
-__all__ = ['BaseModel', 'adam', 'handle_interrupt', 'Trainer', 'PredictionExaminer']
+__all__ = ['BaseModel', 'adam', 'handle_interrupt', 'CheckpointWriter', 'Trainer', 'PredictionExaminer']
 
 
 # Cell
-from collections import defaultdict
+from collections import defaultdict, deque
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import partial, wraps
+from glob import glob, escape as glob_escape
+import hashlib
 from inspect import signature
+import json
 import matplotlib.pyplot as plt
 import numpy as np
 import os
@@ -15,6 +20,7 @@ import pandas as pd
 import shutil
 import torch
 import torch.nn as nn
+from torch.cuda.amp import GradScaler
 from torch.utils.data import DataLoader
 from torch.optim import Adam
 from tqdm.auto import tqdm
@@ -22,13 +28,42 @@ import warnings
 
 from htools import load, save, LoggerMixin, valuecheck, hasarg, func_name
 from .callbacks import BasicConfig, StatsHandler, MetricPrinter, \
-    SubsetHandler
-from .data import plot_images
-from .metrics import batch_size
+    SubsetHandler, TorchCallback
+from .data import plot_images, DevicePrefetcher
+from .metrics import batch_size, MetricAccumulator
 from .optimizers import variable_lr_optimizer, update_optimizer
 from .utils import quick_stats, DEVICE, identity
 
 
+# Cell
+def _tensor_hash(tensor):
+    """Hash the contents (plus dtype and shape) of a tensor."""
+    tensor = tensor.detach().contiguous().view(-1)
+    hasher = hashlib.sha1(f'{tensor.dtype}{tuple(tensor.shape)}'.encode())
+    hasher.update(tensor.view(torch.uint8).cpu().numpy().tobytes())
+    return hasher.hexdigest()
+
+
+def _load_checkpoint(path, map_location=None):
+    """Load a checkpoint saved by Trainer.save. Delta checkpoints (see
+    Trainer.save) are transparently merged with their base snapshot so the
+    result always contains the full model state dict.
+    """
+    data = torch.load(path, map_location=map_location)
+    if 'delta_base' in data:
+        base = torch.load(os.path.join(os.path.dirname(path),
+                                       data.pop('delta_base')),
+                          map_location=map_location)['model']
+        delta = data['model']
+        data['model'] = type(delta)(
+            (k, delta[k] if k in delta else base[k])
+            for k in data.pop('model_keys')
+        )
+        # load_state_dict uses this for backward compatibility of modules.
+        if hasattr(base, '_metadata'): data['model']._metadata = base._metadata
+    return data
+
+
 # Cell
 class BaseModel(nn.Module):
 
@@ -124,7 +159,7 @@ class BaseModel(nn.Module):
             return self(*xb)
 
     def load(self, path, map_location=None):
-        state = torch.load(path, map_location=map_location)
+        state = _load_checkpoint(path, map_location=map_location)
         # Check if it's a saved incendio trainer instead of just a model.
         # Think this is pretty safe with torch naming method.
         if 'model' in state: state = state['model']
@@ -137,7 +172,7 @@ class BaseModel(nn.Module):
         if not hasattr(self, 'enc'):
             raise RuntimeError('Model doesn\'t have `enc` attribute.')
 
-        state = torch.load(path, map_location=map_location)
+        state = _load_checkpoint(path, map_location=map_location)
         if 'model' in state: state = state['model']
         self.enc.load_state_dict(state, strict=False)
 
@@ -146,6 +181,13 @@ class BaseModel(nn.Module):
 adam = partial(torch.optim.Adam, eps=1e-3)
 
 
+# Cell
+@contextmanager
+def _null_context():
+    """Stand-in for contextlib.nullcontext, which requires python 3.7."""
+    yield
+
+
 # Cell
 def handle_interrupt(meth):
     """Decorator for Trainer.fit() method that allows the user to
@@ -179,15 +221,143 @@ def handle_interrupt(meth):
     return wrapper
 
 
+# Cell
+class _CallbackDict(dict):
+    """Dict of callbacks that keeps track of whether it's been modified
+    since the trainer last built its hook dispatch table. This lets callbacks
+    be added or removed at any point (e.g. BatchMetricPrinter removes itself
+    mid-training) without the trainer having to rescan every callback on
+    every hook call.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dirty = True
+
+    def _modifies(meth):
+        @wraps(meth)
+        def wrapper(self, *args, **kwargs):
+            self.dirty = True
+            return meth(self, *args, **kwargs)
+        return wrapper
+
+    __setitem__ = _modifies(dict.__setitem__)
+    __delitem__ = _modifies(dict.__delitem__)
+    pop = _modifies(dict.pop)
+    popitem = _modifies(dict.popitem)
+    clear = _modifies(dict.clear)
+    update = _modifies(dict.update)
+    setdefault = _modifies(dict.setdefault)
+    del _modifies
+
+
+# Cell
+def _cpu_snapshot(obj, events):
+    """Recursively copy the tensors in a (possibly nested) state dict to the
+    CPU. GPU tensors are copied asynchronously into pinned memory and a cuda
+    event is appended to `events` so the caller can wait for the copies to
+    finish. Because the copies are queued on the current stream, they capture
+    the values at this point even if training continues to update the
+    weights in place afterwards.
+    """
+    if isinstance(obj, torch.Tensor):
+        obj = obj.detach()
+        if not obj.is_cuda: return obj.clone()
+        res = torch.empty(obj.shape, dtype=obj.dtype, pin_memory=True)
+        res.copy_(obj, non_blocking=True)
+        if not events:
+            events.append(torch.cuda.Event())
+        return res
+    if isinstance(obj, dict):
+        res = type(obj)((k, _cpu_snapshot(v, events)) for k, v in obj.items())
+        # load_state_dict uses this for backward compatibility of modules.
+        if hasattr(obj, '_metadata'): res._metadata = obj._metadata
+        return res
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_cpu_snapshot(v, events) for v in obj)
+    return obj
+
+
+def _save_atomic(data, path, events=(), remove=()):
+    """torch.save to a temp file and then rename it, so a crash mid-write
+    never leaves a torn checkpoint at `path`. Files in `remove` (e.g. a delta
+    checkpoint's old base) are deleted after the new file is in place.
+    """
+    for event in events: event.synchronize()
+    tmp = f'{path}.tmp'
+    torch.save(data, tmp)
+    os.replace(tmp, path)
+    for old in remove:
+        if os.path.exists(old): os.remove(old)
+
+
+class CheckpointWriter:
+    """Saves checkpoints from a background thread so training doesn't block
+    while torch.save writes to disk. `submit` takes a CPU snapshot of the
+    state before returning (so later updates to the weights don't leak into
+    the checkpoint) and files are published atomically in submission order.
+    """
+
+    def __init__(self, max_pending=1):
+        """
+        Parameters
+        ----------
+        max_pending: int
+            Max number of saves in flight. If this many writes are still
+            pending, `submit` waits for the oldest one to finish before
+            taking a new snapshot. This also bounds the memory used by
+            snapshots.
+        """
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(1)
+        self._pending = deque()
+
+    def submit(self, data, path, remove=()):
+        """Snapshot `data` (usually a dict of state dicts) and write it to
+        `path` in the background. Files in `remove` are deleted once it's
+        written.
+        """
+        while len(self._pending) >= self.max_pending:
+            self._pending.popleft().result()
+        events = []
+        data = _cpu_snapshot(data, events)
+        # Record after all copies are queued so one event covers them all.
+        for event in events: event.record()
+        self._pending.append(
+            self._executor.submit(_save_atomic, data, path, events, remove)
+        )
+
+    def wait(self):
+        """Block until all pending writes are finished. Errors from the
+        background thread are raised here.
+        """
+        while self._pending:
+            self._pending.popleft().result()
+
+    @property
+    def n_pending(self):
+        return sum(not future.done() for future in self._pending)
+
+    def __repr__(self):
+        return f'{type(self).__name__}(max_pending={self.max_pending})'
+
+
 # Cell
 class Trainer(LoggerMixin):
 
+    # When a delta checkpoint would contain more than this fraction of the
+    # model's elements, we write a new base snapshot instead.
+    delta_base_ratio = 0.5
+
     @valuecheck
     def __init__(self, net, dl_train, dl_val, criterion,
                  mode:('binary', 'multiclass', 'regression'),
                  out_dir, optim=None, optim_type=Adam, eps=1e-3,
                  last_act=None, threshold=0.5, metrics=None, callbacks=None,
-                 device=DEVICE):
+                 device=DEVICE, prefetch=0, pin_memory=True,
+                 precision:('fp32', 'fp16', 'bf16')='fp32',
+                 accumulate_steps=1, micro_batch_size=None,
+                 split_on_oom=False):
         """An object to handle model training. This makes it easy for us to
         model weights, optimizer state, datasets and dataloaders all
         at once.
@@ -260,6 +430,45 @@ class Trainer(LoggerMixin):
             Trainer will place the model and current batch of data on this
             device during training. The default value uses a GPU if one is
             available, otherwise falls back to a CPU.
+        prefetch: int
+            If greater than 0, train and validation batches are loaded and
+            copied to `device` in a background thread (see DevicePrefetcher)
+            so that batch N+1 is staged while batch N is being processed.
+            The value determines how many batches can be staged ahead of the
+            current one. 0 disables prefetching.
+        pin_memory: bool
+            Only used when prefetching onto a GPU. If True, batches are copied
+            from pinned memory with non-blocking copies.
+        precision: str
+            One of ('fp32', 'fp16', 'bf16'). With 'fp16' or 'bf16', the
+            forward pass and loss computation run under autocast with that
+            dtype. 'fp16' also uses a gradient scaler (only on a GPU), which
+            is available to callbacks as `trainer.scaler` (e.g. call
+            `trainer.scaler.unscale_(trainer.optim)` before clipping
+            gradients). 'bf16' works on CPU as well but requires
+            torch>=1.10 (on older versions, 'fp16' only has an effect on a
+            GPU).
+        accumulate_steps: int
+            Number of dataloader batches to accumulate gradients over before
+            each optimizer step. Losses are scaled so the update is the same
+            as training on one batch that's `accumulate_steps` times larger.
+            Callbacks' `on_batch_begin`, `after_zero_grad`, `after_backward`,
+            `after_step`, and `on_batch_end` methods are called once per
+            optimizer step (so `i` and `sum_i` count optimizer steps), while
+            `after_forward` and `after_loss` are called for every micro batch.
+        micro_batch_size: int or None
+            If provided, dataloader batches larger than this are split into
+            chunks of at most this many rows, each with its own forward and
+            backward pass (gradients are accumulated so the result is the
+            same as processing the whole batch at once). This assumes all
+            tensors in a batch have the batch dimension first.
+        split_on_oom: bool
+            If True, a batch (or micro batch) that runs out of GPU memory is
+            split in half and retried, and that smaller size is used for the
+            rest of training. Only errors raised before the backward pass
+            starts are retried: if the backward pass itself runs out of
+            memory, part of the chunk's gradient may already have been
+            accumulated so we raise an error instead.
 
         Reference
         ---------
@@ -295,6 +504,22 @@ class Trainer(LoggerMixin):
         self.device = device
         self.last_act = last_act or identity
         self.thresh = threshold
+        self.prefetch = prefetch
+        self.pin_memory = pin_memory
+        # torch.autocast (needed for bf16) was added in torch 1.10.
+        if precision == 'bf16' and not hasattr(torch, 'autocast'):
+            raise ValueError('bf16 precision requires torch>=1.10.')
+        self.precision = precision
+        self.accumulate_steps = accumulate_steps
+        self.micro_batch_size = micro_batch_size
+        self.split_on_oom = split_on_oom
+        # May be decreased during training if split_on_oom is True.
+        self._micro_bs = micro_batch_size
+        # No-op unless we're using fp16 on a GPU.
+        self.scaler = GradScaler(
+            enabled=precision == 'fp16'
+            and torch.device(device).type == 'cuda'
+        )
         self._stop_training = False
         # For now, only print logs. During training, a file will be created.
         self.logger = self.get_logger()
@@ -315,8 +540,11 @@ class Trainer(LoggerMixin):
              + (callbacks or [])
         )
         self.metrics = [batch_size] + (metrics or [])
+        self.checkpoint_writer = CheckpointWriter()
+        self._delta_bases = {}
+        self._hash_cache = {}
 
-    def save(self, fname):
+    def save(self, fname, blocking=True, delta=False):
         """Save model and optimizer state dicts for later use. This
         includes the model, optimizer. Datasets and data loaders are
         excluded since:
@@ -330,6 +558,21 @@ class Trainer(LoggerMixin):
             an `out_dir` attribute which will be used). The extension must
             be .pkl or .zip, and will determine whether the trainer is
             compressed.
+        blocking: bool
+            If False, take a CPU snapshot of the state and write it from a
+            background thread (see `CheckpointWriter`) so training can
+            continue in the meantime. `load` and the end of training wait for
+            pending writes (you can also call `wait_for_saves`). Either way,
+            the file is written atomically.
+        delta: bool
+            If True, save a delta checkpoint: the first save with a given
+            fname writes a full base snapshot of the model to
+            {fname}.base-{hash}, and later saves only store tensors that
+            require grad or whose content hash differs from the base (along
+            with the optimizer state). This saves a lot of I/O when most of
+            the model is frozen. A new base is written when the delta would
+            cover more than `delta_base_ratio` of the model. `load` and
+            BaseModel.load reassemble the full state automatically.
 
         Returns
         -------
@@ -340,7 +583,86 @@ class Trainer(LoggerMixin):
             data['optim'] = self.optim.state_dict()
         except AttributeError:
             self.logger.warning('No optimizer. Only saving model state dict.')
-        torch.save(data, os.path.join(self.out_dir, fname))
+        if self.scaler.is_enabled(): data['scaler'] = self.scaler.state_dict()
+        path = os.path.join(self.out_dir, fname)
+        base, remove = None, ()
+        if delta: data, base, remove = self._delta_checkpoint(fname, data)
+        if blocking:
+            # Make sure an older background save can't overwrite this one.
+            self.wait_for_saves()
+            if base: _save_atomic(*base)
+            _save_atomic(data, path, remove=remove)
+        else:
+            if base: self.checkpoint_writer.submit(*base)
+            self.checkpoint_writer.submit(data, path, remove=remove)
+
+    def _state_hashes(self, state, names):
+        """Content hashes of the specified tensors in a state dict. Hashes of
+        parameters are cached and only recomputed when a tensor has been
+        modified in place (tracked by its version counter), so frozen weights
+        are only hashed once. Buffers are always re-hashed since some of them
+        (e.g. BatchNorm running stats) are updated without bumping the
+        version counter.
+        """
+        param_ptrs = {p.data_ptr() for p in self.net.parameters()}
+        res = {}
+        for name in names:
+            tensor = state[name]
+            key = (tensor.data_ptr(), tensor._version)
+            cached = self._hash_cache.get(name)
+            if cached and cached[0] == key and key[0] in param_ptrs:
+                res[name] = cached[1]
+            else:
+                res[name] = _tensor_hash(tensor)
+                self._hash_cache[name] = (key, res[name])
+        return res
+
+    def _delta_checkpoint(self, fname, data):
+        """Split checkpoint data into a delta and (if necessary) a new base
+        snapshot.
+
+        Returns
+        -------
+        tuple: Delta data to save to fname, (base data, base path) or None
+        if the existing base can be reused, and a list of stale base paths
+        to delete once the delta is written. Stale bases are found on disk
+        so files left behind by earlier processes are cleaned up too.
+        """
+        state = data['model']
+        trainable = {name for name, p in self.net.named_parameters()
+                     if p.requires_grad}
+        base = self._delta_bases.get(fname)
+        frozen = self._state_hashes(state,
+                                    [k for k in state if k not in trainable])
+        delta = {**data, 'model_keys': list(state)}
+        if base:
+            changed = [k for k in state if k in trainable
+                       or frozen[k] != base['hashes'].get(k)]
+            if sum(state[k].numel() for k in changed) <= \
+                    self.delta_base_ratio * sum(v.numel()
+                                                for v in state.values()):
+                delta['model'] = type(state)((k, state[k]) for k in changed)
+                delta['delta_base'] = os.path.basename(base['path'])
+                return delta, None, ()
+
+        # Write a new base. The delta is empty until weights change.
+        hashes = {**frozen, **self._state_hashes(state, trainable)}
+        token = hashlib.sha1(json.dumps(hashes, sort_keys=True).encode())
+        path = os.path.join(self.out_dir, fname)
+        base_path = f'{path}.base-{token.hexdigest()[:10]}'
+        self._delta_bases[fname] = {'path': base_path, 'hashes': hashes}
+        delta['model'] = type(state)()
+        # Bases live next to the delta so we only store the file name.
+        delta['delta_base'] = os.path.basename(base_path)
+        # The previous base may still be queued in the CheckpointWriter.
+        stale = set(glob(f'{glob_escape(path)}.base-*'))
+        if base: stale.add(base['path'])
+        stale.discard(base_path)
+        return delta, ({'model': state}, base_path), sorted(stale)
+
+    def wait_for_saves(self):
+        """Block until any non-blocking saves have been written to disk."""
+        self.checkpoint_writer.wait()
 
     def load(self, fname=None, old_path=None):
         """This lets a trainer load previously saved model and optimizer
@@ -371,8 +693,9 @@ class Trainer(LoggerMixin):
         trainer = trainer.load('v1')
         """
         path = old_path or os.path.join(self.out_dir, fname)
+        self.wait_for_saves()
         self.logger.info(f'Loading weights from {path}.')
-        data = torch.load(path, map_location=self.device)
+        data = _load_checkpoint(path, map_location=self.device)
         self.net.load_state_dict(data['model'])
 
         # Create optimizer to load state dict. LR will be updated later.
@@ -385,6 +708,8 @@ class Trainer(LoggerMixin):
         except (AttributeError, KeyError) as e:
             self.logger.warning('Could not load optimizer. '
                                 ' Loading model weights only.\n' + repr(e))
+        if 'scaler' in data and self.scaler.is_enabled():
+            self.scaler.load_state_dict(data['scaler'])
 
     def load_encoder(self, path):
         """Wrapper to BaseModel's `load_encoder` method. Ignore optimizer
@@ -409,8 +734,38 @@ class Trainer(LoggerMixin):
         None
         """
         self.callbacks.update({type(cb).__name__: cb for cb in callbacks})
-        self.callbacks = dict(sorted(self.callbacks.items(),
-                                     key=lambda x: x[1].order))
+        self.callbacks = sorted(self.callbacks.items(),
+                                key=lambda x: x[1].order)
+
+    @property
+    def callbacks(self):
+        return self._callbacks
+
+    @callbacks.setter
+    def callbacks(self, callbacks):
+        """Accepts a dict or an iterable of (name, callback) pairs. Hook
+        dispatch table is rebuilt lazily on the next call to `decide_stop`.
+        """
+        self._callbacks = _CallbackDict(callbacks)
+
+    def _build_hooks(self):
+        """Map each hook name (e.g. 'on_batch_end') to the bound methods of
+        the callbacks that actually implement it, in callback order.
+        Callbacks that just inherit TorchCallback's no-op are skipped so they
+        cost nothing at training time.
+        """
+        hooks = defaultdict(list)
+        for cb in self.callbacks.values():
+            for name in vars(TorchCallback):
+                if name.startswith('_'): continue
+                meth = getattr(cb, name, None)
+                if meth is None or \
+                        getattr(meth, '__func__', None) \
+                        is getattr(TorchCallback, name):
+                    continue
+                hooks[name].append(meth)
+        self._hooks = dict(hooks)
+        self.callbacks.dirty = False
 
     def add_metrics(self, *metrics):
         """Add additional metrics to track. See the `metrics` parameter in
@@ -477,30 +832,36 @@ class Trainer(LoggerMixin):
             this run. Useful for debugging purposes). All kwargs
             are passed to callbacks during the `on_train_begin` step.
         """
-        self.stats = defaultdict(list)
+        self.stats = MetricAccumulator(self.metrics)
         sum_i = 0
         _ = self.decide_stop('on_train_begin', epochs, lrs, lr_mult, **kwargs)
         for e in range(epochs):
             _ = self.decide_stop('on_epoch_begin', e, None)
-            for i, batch in enumerate(self.pbar):
-                _ = self.decide_stop('on_batch_begin', i, sum_i)
-                sum_i += 1
+            n_batches = len(self.pbar)
+            # `i` counts optimizer steps, `j` counts dataloader batches.
+            i = -1
+            for j, batch in enumerate(self.pbar):
+                group_j = j % self.accumulate_steps
+                if group_j == 0:
+                    i += 1
+                    # Last group of the epoch may be smaller.
+                    group_len = min(self.accumulate_steps, n_batches - j)
+                    _ = self.decide_stop('on_batch_begin', i, sum_i)
+                    sum_i += 1
                 xb, yb = self._unpack_batch(batch)
-                self.optim.zero_grad()
-                _ = self.decide_stop('after_zero_grad', i, sum_i, xb, yb)
-
-                # Forward and backward passes.
-                y_score = self._forward_pass(xb, yb)
-                if self.decide_stop('after_forward', i, sum_i): break
-                loss = self._compute_loss(y_score, yb, xb, e=e, sum_i=sum_i)
-                if self.decide_stop('after_loss', i, sum_i): break
-                loss.backward()
+                if group_j == 0:
+                    self.optim.zero_grad()
+                    _ = self.decide_stop('after_zero_grad', i, sum_i, xb, yb)
+
+                # Forward and backward passes (also updates stats).
+                if self._accumulate_grads(xb, yb, group_len, e, i, sum_i):
+                    break
+                if group_j < group_len - 1: continue
                 if self.decide_stop('after_backward', i, sum_i): break
-                self.optim.step()
+                # Scaler methods fall back to the regular ones when disabled.
+                self.scaler.step(self.optim)
+                self.scaler.update()
                 if self.decide_stop('after_step', i, sum_i): break
-
-                # Separate because callbacks are only applied during training.
-                self._update_stats(self.stats, loss, yb, y_score)
                 if self.decide_stop('on_batch_end', i, sum_i): break
 
             # If on_batch_end callback halts training, else block is skipped.
@@ -511,6 +872,108 @@ class Trainer(LoggerMixin):
             break
         _ = self.decide_stop('on_train_end', e, val_stats)
 
+    def _accumulate_grads(self, xb, yb, group_len, e, i, sum_i):
+        """Forward and backward passes for a single dataloader batch, which
+        may be split into micro batches. Gradients are added to any existing
+        ones, with each loss scaled by the fraction of the optimizer step's
+        rows it represents. Stats are updated once for the whole dataloader
+        batch (predictions from each micro batch are concatenated) so
+        metrics that can't be accumulated aren't computed on tiny chunks.
+
+        Parameters
+        ----------
+        xb: list[torch.Tensor]
+            Inputs from `_unpack_batch`.
+        yb: torch.Tensor
+            Labels from `_unpack_batch`.
+        group_len: int
+            Number of dataloader batches contributing to the current
+            optimizer step.
+        e: int
+            Current epoch.
+        i: int
+            Current optimizer step within the epoch.
+        sum_i: int
+            Global optimizer step.
+
+        Returns
+        -------
+        bool: If True, a callback has requested that training halt.
+        """
+        n = yb.shape[0]
+        start = 0
+        losses, scores = [], []
+        while start < n:
+            size = min(self._micro_bs or n, n - start)
+            xb_mb, yb_mb = self._slice_batch(xb, yb, start, size)
+            backward_started = False
+            try:
+                with self._autocast():
+                    y_score = self._forward_pass(xb_mb, yb_mb)
+                if self.decide_stop('after_forward', i, sum_i): return True
+                with self._autocast():
+                    loss = self._compute_loss(y_score, yb_mb, xb_mb, e=e,
+                                              sum_i=sum_i)
+                if self.decide_stop('after_loss', i, sum_i): return True
+                backward_started = True
+                self.scaler.scale(loss * size / n / group_len).backward()
+            except RuntimeError as err:
+                if not (self.split_on_oom and 'out of memory' in str(err)
+                        and size > 1):
+                    raise
+                # Part of this chunk's gradient may already have been added,
+                # so retrying would step on the wrong gradient.
+                if backward_started:
+                    raise RuntimeError(
+                        f'Out of memory during the backward pass with micro '
+                        f'batch size {size}. Gradients may be partially '
+                        'accumulated so we can\'t safely retry. Try setting '
+                        'a smaller `micro_batch_size`.'
+                    ) from err
+                y_score = loss = None
+                if torch.cuda.is_available(): torch.cuda.empty_cache()
+                self._micro_bs = size // 2
+                self.logger.warning(f'Out of memory with micro batch size '
+                                    f'{size}. Retrying with '
+                                    f'{self._micro_bs}.')
+                continue
+
+            losses.append(loss.detach() * size)
+            scores.append(y_score.detach())
+            start += size
+
+        # Separate because callbacks are only applied during training.
+        self._update_stats(self.stats, sum(losses) / n, yb,
+                           scores[0] if len(scores) == 1
+                           else torch.cat(scores))
+        return False
+
+    @staticmethod
+    def _slice_batch(xb, yb, start, size):
+        """Select rows [start, start + size) of a batch. Rows are assumed
+        to lie along the first dimension of each tensor in xb and yb.
+        """
+        if start == 0 and size == yb.shape[0]: return xb, yb
+        xb = [x[start:start + size] if isinstance(x, torch.Tensor) else x
+              for x in xb]
+        return xb, yb[start:start + size]
+
+    def steps_per_epoch(self, dl=None):
+        """Number of optimizer steps in one pass through a dataloader,
+        accounting for gradient accumulation.
+
+        Parameters
+        ----------
+        dl: torch.utils.data.DataLoader or None
+            Defaults to the current training dataloader.
+
+        Returns
+        -------
+        int
+        """
+        n_batches = len(dl or self._dl_train_curr)
+        return int(np.ceil(n_batches / self.accumulate_steps))
+
     def validate(self, dl_val=None, return_preds=False, return_labels=False,
                  logits=True):
         """Evaluate the model on a validation set.
@@ -531,12 +994,13 @@ class Trainer(LoggerMixin):
 
         Returns
         -------
-        list[dict, torch.tensor(s)]: First item is a dict of metrics. A tensor
+        list[dict, torch.tensor(s)]: First item is a dict of metrics
+        (a finalized MetricAccumulator) computed over the whole dataset. A tensor
         of predictions is appended as a second item if `return_preds`,
         followed by a tensor of labels if `return_labels`.
         """
         dl_val = dl_val or self._dl_val_curr
-        val_stats = defaultdict(list)
+        val_stats = MetricAccumulator(self.metrics)
         self.net.eval()
         preds = []
         labels = []
@@ -550,15 +1014,17 @@ class Trainer(LoggerMixin):
         # the model on the GPU).
         if return_preds: self.net.to(self.device)
         with torch.no_grad():
-            for batch in tqdm(dl_val, leave=False):
+            for batch in tqdm(self._prefetch(dl_val), leave=False):
                 xb, yb = self._unpack_batch(batch)
-                y_score = self._forward_pass(xb, yb)
-                loss = self._compute_loss(y_score, yb, xb, is_train=False)
+                with self._autocast():
+                    y_score = self._forward_pass(xb, yb)
+                    loss = self._compute_loss(y_score, yb, xb,
+                                              is_train=False)
                 self._update_stats(val_stats, loss, yb, y_score)
                 if return_preds: preds.append(y_score)
                 if return_labels: labels.append(yb)
 
-        res = [val_stats]
+        res = [val_stats.finalize()]
         if preds:
             preds = torch.cat(preds, dim=0)
             if not logits: preds = self.last_act(preds)
@@ -568,6 +1034,39 @@ class Trainer(LoggerMixin):
             res.append(labels)
         return res
 
+    def _prefetch(self, dl):
+        """Wrap a dataloader in a DevicePrefetcher if prefetching is enabled.
+        This is called each time we iterate over a dataloader, so it works
+        with whatever `_dl_train_curr`/`_dl_val_curr` are at the time
+        (e.g. after SubsetHandler swaps in a subset).
+
+        Parameters
+        ----------
+        dl: torch.utils.data.DataLoader
+
+        Returns
+        -------
+        DevicePrefetcher or DataLoader: The input dataloader if
+        `self.prefetch` is 0.
+        """
+        if not self.prefetch: return dl
+        return DevicePrefetcher(dl, self.device, self.prefetch,
+                                self.pin_memory)
+
+    def _autocast(self):
+        """Context manager for the forward pass and loss computation. This
+        is a no-op unless `precision` is 'fp16' or 'bf16'.
+        """
+        if self.precision == 'fp32': return _null_context()
+        if not hasattr(torch, 'autocast'):
+            # Older versions of torch only support fp16 autocast on GPU.
+            return torch.cuda.amp.autocast()
+        return torch.autocast(
+            torch.device(self.device).type,
+            dtype=torch.float16 if self.precision == 'fp16'
+            else torch.bfloat16
+        )
+
     def _to_device(self, tensors, to_list=False):
         """Put a list/tuple of tensors on the GPU if one is available.
 
@@ -674,11 +1173,12 @@ class Trainer(LoggerMixin):
         return res
 
     def _update_stats(self, stats, loss, yb, y_score):
-        """Update stats in place.
+        """Update stats in place. Nothing is copied off the device here
+        unless a metric isn't accumulable (see `incendio.metrics.accumulable`).
 
         Parameters
         ----------
-        stats: defaultdict[str, list]
+        stats: MetricAccumulator
         loss: torch.Tensor
             Tensor containing single value (mini-batch loss).
         yb: torch.Tensor
@@ -692,7 +1192,10 @@ class Trainer(LoggerMixin):
         -------
         None
         """
-        yb, y_score = yb.detach().cpu(), y_score.detach().cpu()
+        yb, y_score = yb.detach(), y_score.detach()
+        # Under autocast, predictions may be half precision, which many
+        # metrics (e.g. anything that converts to numpy) don't support.
+        if y_score.is_floating_point(): y_score = y_score.float()
         # Final activation often excluded from network architecture.
         y_score = self.last_act(y_score)
 
@@ -705,10 +1208,7 @@ class Trainer(LoggerMixin):
         elif self.mode == 'regression':
             y_pred = y_score
 
-        stats['loss'].append(loss.detach().cpu().numpy().item())
-        for m in self.metrics:
-            yhat = y_pred if hasarg(m, 'y_pred') else y_score
-            stats[m.__name__.replace('_score', '')].append(m(yb, yhat))
+        stats.accumulate(loss, yb, y_score, y_pred)
 
     def decide_stop(self, attr, *args, **kwargs):
         """Evaluates each of the trainer's callbacks. If any callback
@@ -731,9 +1231,11 @@ class Trainer(LoggerMixin):
         bool: If True, halt training.
         """
         self._stop_training = False
-        # Pass model object as first argument to callbacks.
-        for cb in self.callbacks.values():
-            getattr(cb, attr)(self, *args, **kwargs)
+        if self.callbacks.dirty: self._build_hooks()
+        # Pass model object as first argument to callbacks. Iterate over the
+        # current table so callbacks can safely remove themselves.
+        for meth in self._hooks.get(attr, ()):
+            meth(self, *args, **kwargs)
         return self._stop_training
 
     def unfreeze(self, n_layers=None, n_groups=None, msg_pre=''):
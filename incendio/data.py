@@ -1,21 +1,34 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: notebooks/07_data.ipynb (unless otherwise specified).
 
-__all__ = ['probabilistic_hash_item', 'probabilistic_hash_tensor', 'plot_images', 'RandomTransform', 'RandomPipeline',
-           'dataloader_subset', 'BotoUploader', 'plot_images']
+__all__ = ['probabilistic_hash_item', 'probabilistic_hash_tensor', 'vectorized_hash_tensor', 'plot_images',
+           'RandomTransform', 'RandomPipeline', 'dataloader_subset', 'DevicePrefetcher', 'LocalS3Client',
+           'BotoUploader', 'plot_images']
 
 
 # Cell
 import boto3
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError, HTTPClientError, \
+    ConnectionError as BotoConnectionError
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+from glob import glob
+import hashlib
+import json
 import mmh3
 import matplotlib.pyplot as plt
-from multiprocessing import Pool
 import numpy as np
 import os
 import pandas as pd
+from queue import Queue, Empty, Full
+import shutil
+import threading
+import time
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, DataLoader
 from tqdm.auto import tqdm
 import warnings
 
@@ -93,6 +106,59 @@ def probabilistic_hash_tensor(x_r2, n_buckets, n_hashes=3, pad_idx=0):
     )
 
 
+# Cell
+_MASK_32 = 0xFFFFFFFF
+
+
+def _fmix32(h):
+    """Murmur3's 32 bit finalizer. Works on python ints or int64 tensors
+    holding values in [0, 2**32): products may wrap around in int64 but the
+    low 32 bits we keep are unaffected.
+    """
+    h = h ^ (h >> 16)
+    h = (h * 0x85ebca6b) & _MASK_32
+    h = h ^ (h >> 13)
+    h = (h * 0xc2b2ae35) & _MASK_32
+    return h ^ (h >> 16)
+
+
+def vectorized_hash_tensor(x, n_buckets, n_hashes=3, pad_idx=0):
+    """Hash a LongTensor of indices using only tensor operations, so unlike
+    `probabilistic_hash_tensor` there's no python loop and the computation
+    stays on whatever device `x` is on. Each of the `n_hashes` hash functions
+    is murmur3's finalizer applied to the input xor'd with a different fixed
+    seed, so outputs are deterministic across runs and devices (though they
+    do NOT match the mmh3-based outputs of `probabilistic_hash_tensor`).
+
+    Parameters
+    ----------
+    x: torch.LongTensor
+        Tensor of non-negative integers of any shape, typically
+        (bs, seq_len).
+    n_buckets: int
+        Number of buckets to hash items into (i.e. the number of
+        rows in the embedding matrix).
+    n_hashes: int
+        Number of hashes to take for each input index.
+    pad_idx: int or None
+        If an integer is provided, inputs equal to it will be mapped to
+        `pad_idx` for every hash. If None, no padding index will be used.
+
+    Returns
+    -------
+    torch.LongTensor: Tensor of indices with one more dimension than the
+        input. Shape: (*x.shape, n_hashes)
+    """
+    seeds = torch.tensor([_fmix32(i + 1) for i in range(n_hashes)],
+                         dtype=torch.long, device=x.device)
+    # Fold any high bits into the low 32 so large ids don't collide trivially.
+    x = x.long()
+    h = (x ^ (x >> 32)) & _MASK_32
+    hashed = _fmix32(h.unsqueeze(-1) ^ seeds) % n_buckets
+    if pad_idx is None: return hashed
+    return hashed.masked_fill((x == pad_idx).unsqueeze(-1), pad_idx)
+
+
 # Cell
 def plot_images(images, titles=None, nrows=None, figsize=None,
                 tight_layout=True, title_colors=None):
@@ -251,13 +317,198 @@ def dataloader_subset(dl, batches=1):
 
 
 # Cell
+def _map_tensors(func, batch):
+    """Apply a function to every tensor in a (possibly nested) list, tuple,
+    namedtuple, or dict, leaving other objects untouched.
+    """
+    if isinstance(batch, torch.Tensor): return func(batch)
+    if isinstance(batch, tuple) and hasattr(batch, '_fields'):
+        # Namedtuples take fields as separate args rather than an iterable.
+        return type(batch)(*(_map_tensors(func, x) for x in batch))
+    if isinstance(batch, (list, tuple)):
+        return type(batch)(_map_tensors(func, x) for x in batch)
+    if isinstance(batch, dict):
+        return {k: _map_tensors(func, v) for k, v in batch.items()}
+    return batch
+
+
+class DevicePrefetcher:
+    """Wraps a dataloader so that upcoming batches are loaded and copied to
+    the target device in a background thread while the current batch is
+    being processed. On a GPU, batches are copied from pinned memory with
+    non-blocking copies on a separate CUDA stream; on a CPU, the thread still
+    lets collation overlap with compute. Iterating over the prefetcher yields
+    the same batches as the wrapped dataloader, except that tensors are
+    already on `device` (so later `.to(device)` calls are no-ops).
+    """
+
+    def __init__(self, dl, device, depth=2, pin_memory=True):
+        """
+        Parameters
+        ----------
+        dl: Iterable
+            Typically a torch DataLoader. A new iterator is created each time
+            the prefetcher is iterated over.
+        device: torch.device or str
+            Device to move batches to.
+        depth: int
+            Max number of batches to stage ahead of the one currently being
+            used.
+        pin_memory: bool
+            If True and `device` is a GPU, pin tensors before copying them so
+            the copy can be asynchronous. Has no effect on a CPU.
+        """
+        if depth < 1: raise ValueError('depth must be a positive integer.')
+        self.dl = dl
+        self.device = torch.device(device)
+        self.depth = depth
+        self.pin_memory = pin_memory
+        self.cuda = self.device.type == 'cuda'
+
+    def _transfer(self, x):
+        if self.cuda and self.pin_memory and not x.is_pinned():
+            x = x.pin_memory()
+        return x.to(self.device, non_blocking=self.cuda)
+
+    def _worker(self, q, stop):
+        """Runs in background thread. Each queue item is a tuple of
+        (batch, cuda_event, exception) and None marks the end of the data.
+        """
+        stream = torch.cuda.Stream(self.device) if self.cuda else None
+        try:
+            for batch in self.dl:
+                event = None
+                if stream is None:
+                    batch = _map_tensors(self._transfer, batch)
+                else:
+                    with torch.cuda.stream(stream):
+                        batch = _map_tensors(self._transfer, batch)
+                        event = torch.cuda.Event()
+                        event.record(stream)
+                if not self._put(q, (batch, event, None), stop): return
+            self._put(q, None, stop)
+        except Exception as e:
+            self._put(q, (None, None, e), stop)
+
+    @staticmethod
+    def _put(q, item, stop):
+        """Blocking put that gives up if the consumer stopped iterating
+        (e.g. training was halted mid-epoch). Returns False in that case.
+        """
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def __iter__(self):
+        q = Queue(maxsize=self.depth)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._worker, args=(q, stop),
+                                  daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = q.get()
+                if item is None: break
+                batch, event, error = item
+                if error is not None: raise error
+                if event is not None:
+                    stream = torch.cuda.current_stream(self.device)
+                    stream.wait_event(event)
+                    # Keep the caching allocator from reusing this memory
+                    # before the compute stream is done with it.
+                    _map_tensors(lambda x: x.record_stream(stream), batch)
+                yield batch
+        finally:
+            stop.set()
+            # Unblock worker if it's waiting on a full queue.
+            while True:
+                try:
+                    q.get_nowait()
+                except Empty:
+                    break
+            thread.join()
+
+    def __len__(self):
+        return len(self.dl)
+
+    def __repr__(self):
+        return f'{type(self).__name__}(dl={self.dl!r}, ' \
+               f'device={str(self.device)!r}, depth={self.depth})'
+
+
+# Cell
+def _s3_etag(path, multipart_threshold, multipart_chunksize):
+    """Compute the ETag S3 will assign to a file uploaded with the given
+    multipart settings: the md5 of the file for single part uploads, or the
+    md5 of the concatenated part md5s followed by the number of parts for
+    multipart uploads.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if size < multipart_threshold:
+            return '"' + hashlib.md5(f.read()).hexdigest() + '"'
+        parts = [hashlib.md5(chunk).digest()
+                 for chunk in iter(partial(f.read, multipart_chunksize), b'')]
+    return f'"{hashlib.md5(b"".join(parts)).hexdigest()}-{len(parts)}"'
+
+
+class LocalS3Client:
+    """Filesystem-backed stand-in for a boto3 S3 client, implementing the
+    small subset of methods BotoUploader uses. Objects are stored at
+    {root}/{bucket}/{key}. Useful for tests and offline development.
+    """
+
+    def __init__(self, root, multipart_threshold=8 * 1024**2,
+                 multipart_chunksize=8 * 1024**2):
+        self.root = str(root)
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.n_uploads = 0
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, key.lstrip('/'))
+
+    def upload_file(self, Filename, Bucket, Key, Config=None, **kwargs):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(Filename, path)
+        self.n_uploads += 1
+
+    def head_object(self, Bucket, Key, **kwargs):
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise ClientError({'Error': {'Code': '404',
+                                         'Message': 'Not Found'}},
+                              'HeadObject')
+        return {'ContentLength': os.path.getsize(path),
+                'ETag': _s3_etag(path, self.multipart_threshold,
+                                 self.multipart_chunksize)}
+
+    def __repr__(self):
+        return f'{type(self).__name__}(root={self.root!r})'
+
+
 class BotoUploader:
     """Uploads files to S3. Built as a public alternative to Accio. Note to
     self: the interfaces are not identical so be careful to know which you're
     using.
+
+    Uploads are incremental: a file is skipped when its ETag (computed
+    locally, see `_s3_etag`) matches the remote object's ETag. Local ETags
+    are cached in a manifest keyed by S3 path along with each file's size and
+    mtime, so unchanged files aren't re-hashed. Files are uploaded by a pool
+    of threads sharing a single client, large files use multipart uploads,
+    and failed uploads are retried with exponential backoff.
     """
 
-    def __init__(self, bucket, verbose=True):
+    def __init__(self, bucket, verbose=True, client=None, n_threads=16,
+                 manifest_path=None, multipart_threshold=8 * 1024**2,
+                 multipart_chunksize=8 * 1024**2, max_retries=4,
+                 backoff=0.5):
         """
         Parameters
         ----------
@@ -266,13 +517,117 @@ class BotoUploader:
             stick to a single bucket so we can usually keep this fixed. We can
             always change the attribute later if necessary.
         verbose: bool
-            If True, print message when downloading each file.
+            If True, print message when uploading each file.
+        client: boto3 S3 client or None
+            If None, we create one with boto3 whose connection pool is large
+            enough for all our threads. Clients are thread safe so a single
+            one is shared by all threads. You can also pass in a
+            LocalS3Client for testing.
+        n_threads: int
+            Number of files to upload concurrently (multipart uploads of large
+            files also use this many threads per file).
+        manifest_path: str, Path, or None
+            Json file where local ETags are cached across runs. If None, they
+            are only cached in memory by this object.
+        multipart_threshold: int
+            Files of at least this many bytes use multipart uploads.
+        multipart_chunksize: int
+            Size of each part in bytes for multipart uploads.
+        max_retries: int
+            Number of times to retry a failed upload. Only errors that may be
+            transient (S3 errors, failed uploads, and connection problems)
+            are retried.
+        backoff: float
+            Seconds to wait before the first retry. This doubles after each
+            failed attempt.
         """
-        self.s3 = boto3.resource('s3')
         self.bucket = bucket
         self.verbose = verbose
-
-    def upload_file(self, path, s3_dir='', retain_tree=True):
+        self.n_threads = n_threads
+        self.client = client or self._make_client()
+        self.manifest_path = manifest_path
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=n_threads
+        )
+        self._lock = threading.Lock()
+        self.manifest = self._load_manifest()
+
+    def _make_client(self):
+        # Botocore only keeps 10 connections by default, so threads would
+        # otherwise wait on each other (and log "connection pool is full"
+        # warnings).
+        return boto3.client('s3', config=Config(
+            max_pool_connections=max(10, 2 * self.n_threads)
+        ))
+
+    def _load_manifest(self):
+        if self.manifest_path and os.path.isfile(self.manifest_path):
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return {}
+
+    def _save_manifest(self):
+        if not self.manifest_path: return
+        tmp = f'{self.manifest_path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def _local_etag(self, path, s3_path):
+        """ETag of a local file, reusing the manifest entry if the file's size
+        and mtime haven't changed.
+        """
+        stat = os.stat(path)
+        entry = self.manifest.get(s3_path, {})
+        if entry.get('size') == stat.st_size \
+                and entry.get('mtime') == stat.st_mtime:
+            return entry['etag']
+        etag = _s3_etag(path, self.multipart_threshold,
+                        self.multipart_chunksize)
+        with self._lock:
+            self.manifest[s3_path] = {'size': stat.st_size,
+                                      'mtime': stat.st_mtime, 'etag': etag}
+        return etag
+
+    def _remote_etag(self, s3_path):
+        """Returns None if the object doesn't exist."""
+        try:
+            return self._retry(self.client.head_object, Bucket=self.bucket,
+                               Key=s3_path)['ETag']
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+
+    def _retry(self, func, *args, **kwargs):
+        """Call func, retrying with exponential backoff if it fails with an
+        error that may be transient. Missing objects aren't retried, and
+        other exceptions (e.g. a missing local file) are raised immediately.
+        """
+        for i in range(self.max_retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except ClientError as e:
+                if e.response['Error']['Code'] in ('404', 'NoSuchKey') \
+                        or i == self.max_retries:
+                    raise
+                err = e
+            except (S3UploadFailedError, BotoConnectionError,
+                    HTTPClientError) as e:
+                if i == self.max_retries: raise
+                err = e
+            wait = self.backoff * 2**i
+            warnings.warn(f'{func_name(func)} failed ({err!r}). Retrying '
+                          f'in {wait:.1f}s.')
+            time.sleep(wait)
+
+    def upload_file(self, path, s3_dir='', retain_tree=True, force=False):
         """Upload a single local file. By default, its path in S3 will be the
         same as its local path. Usually, this means your S3 bucket will have a
         single directory called "data" which corresponds exactly to your local
@@ -290,15 +645,40 @@ class BotoUploader:
             If True, the local file structure will be retained. Otherwise,
             only the base name is kept. All four combinations of retain_tree
             (True/False) and s3_dir (empty/non-empty) are supported.
+        force: bool
+            If True, upload the file even if an identical copy already
+            exists in S3.
+
+        Returns
+        -------
+        bool: True if the file was uploaded, False if it was skipped because
+        it was unchanged.
+        """
+        try:
+            return self._upload_file(path, s3_dir, retain_tree, force)
+        finally:
+            self._save_manifest()
+
+    def _upload_file(self, path, s3_dir, retain_tree, force):
+        """Upload a single file without saving the manifest (so threads in
+        `upload_files` don't all write to it at once). See `upload_file` for
+        parameter documentation.
         """
         path = str(path)
         s3_path = self._convert_local_path(path, s3_dir, retain_tree)
+        etag = self._local_etag(path, s3_path)
+        if not force and etag == self._remote_etag(s3_path):
+            if self.verbose: print(f'Skipping unchanged file {path}.')
+            return False
+
         if self.verbose: print(f'Uploading {path} -> {s3_path}.')
-        self.s3.meta.client.upload_file(path, self.bucket, s3_path)
+        self._retry(self.client.upload_file, path, self.bucket, s3_path,
+                    Config=self.transfer_config)
+        return True
 
-    def upload_files(self, paths, s3_dir='', retain_tree=True):
-        """Upload multiple files. Only a ~2x speedup over brute force, but I
-        tried threads and that provided no speedup 🤷‍♂️.
+    def upload_files(self, paths, s3_dir='', retain_tree=True, force=False):
+        """Upload multiple files concurrently with a thread pool, skipping
+        files that are unchanged since they were last uploaded.
 
         Parameters
         ----------
@@ -311,15 +691,32 @@ class BotoUploader:
             If True, the local file structure will be retained. Otherwise,
             only the base name is kept. All four combinations of retain_tree
             (True/False) and s3_dir (empty/non-empty) are supported.
+        force: bool
+            If True, upload all files even if identical copies already exist
+            in S3.
+
+        Returns
+        -------
+        dict[str, list[str]]: Local paths that were 'uploaded' and 'skipped'.
         """
-        func = partial(self.upload_file, s3_dir=s3_dir,
-                       retain_tree=retain_tree)
-        with Pool() as p:
-            p.map(func, paths)
+        paths = [str(path) for path in paths]
+        func = partial(self._upload_file, s3_dir=s3_dir,
+                       retain_tree=retain_tree, force=force)
+        try:
+            with ThreadPoolExecutor(self.n_threads) as executor:
+                uploaded = list(executor.map(func, paths))
+        finally:
+            # Keep hashes of the files we did get to.
+            self._save_manifest()
+        res = {'uploaded': [], 'skipped': []}
+        for path, is_uploaded in zip(paths, uploaded):
+            res['uploaded' if is_uploaded else 'skipped'].append(path)
+        return res
 
     def upload_folder(self, dirname, s3_dir, retain_tree=True, recurse=True,
-                      keep_fn=None):
-        """Upload all files in a directory.
+                      keep_fn=None, force=False):
+        """Upload all files in a directory. Unchanged files are skipped (see
+        `upload_files`).
 
         Parameters
         ----------
@@ -342,6 +739,13 @@ class BotoUploader:
             lambda x: os.path.splitext(x)[-1] != '.pkl'
 
             keeps all files except those with an '.pkl' extension.
+        force: bool
+            If True, upload all files even if identical copies already exist
+            in S3.
+
+        Returns
+        -------
+        dict[str, list[str]]: Local paths that were 'uploaded' and 'skipped'.
         """
         if recurse and not retain_tree:
             raise ValueError('retain_tree must be True when uploading '
@@ -350,7 +754,7 @@ class BotoUploader:
         # glob's recursive option only has an effect when using '**'.
         paths = (o for o in glob(pat, recursive=True) if os.path.isfile(o))
         if keep_fn: paths = filter(keep_fn, paths)
-        self.upload_files(paths, s3_dir, retain_tree)
+        return self.upload_files(paths, s3_dir, retain_tree, force)
 
     def _convert_local_path(self, path, s3_dir='', retain_tree=True):
         """Convert local path to s3 path. See public methods for parameter
@@ -360,18 +764,24 @@ class BotoUploader:
         return os.path.join(s3_dir, path)
 
     def __getstate__(self):
-        return {'bucket': self.bucket,
-                'verbose': self.verbose}
+        # Clients and locks can't be pickled. We recreate them on load.
+        return {k: v for k, v in self.__dict__.items()
+                if k not in ('client', '_lock', 'transfer_config')}
 
     def __setstate__(self, data):
-        self.bucket = data['bucket']
-        self.verbose = data['verbose']
-        self.s3 = boto3.resource('s3')
+        self.__dict__.update(data)
+        self.client = self._make_client()
+        self._lock = threading.Lock()
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=self.n_threads
+        )
 
     def __eq__(self, other):
         return type(other) == type(self) \
             and self.bucket == other.bucket \
-            and self.s3 == other.s3 \
+            and self.client == other.client \
             and self.verbose == other.verbose
 
 
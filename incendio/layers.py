@@ -3,8 +3,8 @@
 __all__ = ['GRelu', 'JRelu', 'Mish', 'mish', 'ConvBlock', 'ResBlock', 'ReflectionPaddedConv2d', 'SmoothSoftmaxBase',
            'SmoothSoftmax', 'SmoothLogSoftmax', 'SpatialSoftmax', 'Dropin', 'LinearSkipBlock', 'LinearResBlock',
            'LinearDenseBlock', 'WeightedLinearResBlock', 'SkipConnection', 'trunc_normal_', 'InitializedEmbedding',
-           'BloomEmbedding', 'AxialEncoding', 'MultiAxialEncoding', 'Projector', 'DotProductAttention', 'SiameseBase',
-           'SequentialWithActivations']
+           'HashLookup', 'BloomEmbedding', 'AxialEncoding', 'MultiAxialEncoding', 'Projector', 'DotProductAttention',
+           'SiameseBase', 'SequentialWithActivations']
 
 
 # Cell
@@ -20,7 +20,7 @@ import torch.nn.functional as F
 
 from htools import add_docstring
 from .core import BaseModel
-from .data import probabilistic_hash_tensor
+from .data import probabilistic_hash_tensor, vectorized_hash_tensor
 from .utils import concat, weighted_avg, identity
 
 
@@ -521,6 +521,107 @@ class InitializedEmbedding(nn.Embedding):
                 torch.zero_(self.weight[self.padding_idx])
 
 
+# Cell
+class HashLookup(nn.Module):
+    """Maps word indices to hashed indices (bs, seq_len) ->
+    (bs, seq_len, n_hashes). If a cache size is provided, the hashes for every
+    index in [0, cache_size) are computed once (lazily, on the first forward
+    pass) and stored in a buffer so each subsequent call is a single gather.
+    Because the table is a buffer, it's saved in the state dict and moves
+    with the module when calling `.to(device)`. Like nn.Embedding, indices
+    outside the table raise an error unless `allow_oov=True`.
+    """
+
+    def __init__(self, n_buckets, n_hashes, pad_idx=0, cache_size=None,
+                 vectorized_hash=True, allow_oov=False):
+        """
+        Parameters
+        ----------
+        n_buckets: int
+            Number of buckets to hash items into (i.e. the number of
+            rows in the embedding matrix).
+        n_hashes: int
+            Number of hashes to take for each input index.
+        pad_idx: int or None
+            Inputs equal to this will be mapped to pad_idx for every hash. If
+            None, no padding index will be used.
+        cache_size: int or None
+            If provided, precompute a (cache_size, n_hashes) lookup table
+            (usually the vocab size).
+            If None, every call hashes its inputs directly.
+        vectorized_hash: bool
+            If True, hash with `vectorized_hash_tensor`. Otherwise use the
+            slower mmh3-based `probabilistic_hash_tensor`.
+        allow_oov: bool
+            Only used when cache_size is provided. If True, indices >=
+            cache_size are hashed on the fly. This can be done without a
+            device sync but it means hashing every input again (in-table
+            inputs are replaced with zeros first), so it's opt-in. If False,
+            out-of-range indices raise an error.
+        """
+        super().__init__()
+        self.n_buckets = n_buckets
+        self.n_hashes = n_hashes
+        self.pad_idx = pad_idx
+        self.cache_size = cache_size
+        self.allow_oov = allow_oov
+        self.hash_fn = partial(
+            vectorized_hash_tensor if vectorized_hash
+            else probabilistic_hash_tensor,
+            n_buckets=n_buckets, n_hashes=n_hashes, pad_idx=pad_idx
+        )
+        # Filled with -1 until the first forward pass. We allocate it upfront
+        # (rather than registering None) so state dicts always line up.
+        if cache_size:
+            self.register_buffer(
+                'table', torch.full((cache_size, n_hashes), -1,
+                                    dtype=torch.long)
+            )
+        else:
+            self.table = None
+        self._built = False
+
+    def _build_table(self):
+        if (self.table < 0).any():
+            ids = torch.arange(self.cache_size, device=self.table.device)
+            # Old hash function only accepts rank 2 inputs.
+            self.table.copy_(self.hash_fn(ids[None])[0])
+        self._built = True
+
+    def _load_from_state_dict(self, *args, **kwargs):
+        # A loaded table may or may not have been built yet so we check again
+        # on the next forward pass.
+        self._built = False
+        super()._load_from_state_dict(*args, **kwargs)
+
+    def forward(self, x):
+        """
+        Parameters
+        ----------
+        x: torch.LongTensor
+            Word indices, typically with shape (bs, seq_len).
+
+        Returns
+        -------
+        torch.LongTensor: Hashed indices with shape (*x.shape, n_hashes).
+        """
+        if self.table is None: return self.hash_fn(x)
+        if not self._built: self._build_table()
+        if not self.allow_oov: return self.table[x]
+        # Selecting out-of-table indices with a mask (or checking whether
+        # there are any) would force a device sync on every batch.
+        in_table = x < self.cache_size
+        zeros = torch.zeros_like(x)
+        hashed = self.table[torch.where(in_table, x, zeros)]
+        oov = self.hash_fn(torch.where(in_table, zeros, x)).to(x.device)
+        return torch.where(in_table[..., None], hashed, oov)
+
+    def extra_repr(self):
+        return f'n_buckets={self.n_buckets}, n_hashes={self.n_hashes}, ' \
+               f'pad_idx={self.pad_idx}, cache_size={self.cache_size}, ' \
+               f'allow_oov={self.allow_oov}'
+
+
 # Cell
 class BloomEmbedding(nn.Module):
     """Bloom Embedding layer for memory-efficient word representations.
@@ -540,7 +641,8 @@ class BloomEmbedding(nn.Module):
     """
 
     def __init__(self, n_emb=251, emb_dim=100, n_hashes=4, padding_idx=0,
-                 pre_hashed=False):
+                 pre_hashed=False, vectorized_hash=True, cache_size=None,
+                 allow_oov=False):
         """
         Parameters
         ----------
@@ -568,6 +670,23 @@ class BloomEmbedding(nn.Module):
             Pass in False if the inputs will be word indices that have not yet
             been hashed. In this case, hashing will be done inside the
             `forward` call.
+        vectorized_hash: bool
+            Only used when pre_hashed is False. If True, hash with
+            `vectorized_hash_tensor`, which runs on the input's device without
+            any python loops. If False, fall back to the much slower
+            mmh3-based `probabilistic_hash_tensor` (mostly useful for models
+            trained before the vectorized version existed, since the two
+            produce different hashes).
+        cache_size: int or None
+            Only used when pre_hashed is False. If provided (usually as the
+            vocab size), the hashes of all word indices in [0, cache_size)
+            are computed once on the first forward pass and cached in a
+            buffer (see `HashLookup`), so the per-batch hashing cost becomes
+            a single gather.
+        allow_oov: bool
+            Only used when cache_size is provided. If True, indices >=
+            cache_size are hashed on the fly (see `HashLookup`). Otherwise
+            they raise an error like nn.Embedding.
 
         Suggested values for a vocab size of ~30,000:
 
@@ -584,9 +703,12 @@ class BloomEmbedding(nn.Module):
         self.n_hashes = n_hashes
         self.pad_idx = padding_idx
         self.pre_hashed = pre_hashed
+        self.vectorized_hash = vectorized_hash
+        self.cache_size = cache_size
+        self.allow_oov = allow_oov
         self.process_fn = identity if pre_hashed else \
-            partial(probabilistic_hash_tensor, n_buckets=n_emb,
-                    n_hashes=n_hashes, pad_idx=padding_idx)
+            HashLookup(n_emb, n_hashes, padding_idx, cache_size,
+                       vectorized_hash, allow_oov)
         # Makes interface consistent with nn.Embedding. Don't change name.
         self.embedding_dim = self.emb.embedding_dim
 
@@ -677,19 +799,50 @@ class MultiAxialEncoding(nn.Module):
     """
 
     def __init__(self, vocab_dim, emb_dim, n_blocks=2, pre_hashed=False,
-                 pad_idx=None):
+                 pad_idx=None, vectorized_hash=True, cache_size=None,
+                 allow_oov=False):
+        """
+        Parameters
+        ----------
+        vocab_dim: int
+            Number of words in vocab (or max sequence length if being used for
+            positional encodings).
+        emb_dim: int
+            Size of output vectors. Each block contributes
+            emb_dim // n_blocks dimensions.
+        n_blocks: int
+            Number of embedding matrices (i.e. number of hashes per input).
+        pre_hashed: bool
+            If True, inputs should already be hashed with shape
+            (bs, seq_len, n_blocks). Otherwise hashing is done in `forward`.
+        pad_idx: int or None
+            If necessary, pass in an integer to represent padding. Otherwise
+            no rows are reserved for padding.
+        vectorized_hash: bool
+            If True, hash with `vectorized_hash_tensor`. Otherwise use the
+            slower mmh3-based `probabilistic_hash_tensor`.
+        cache_size: int or None
+            If provided (and pre_hashed is False), precompute hashes for all
+            indices in [0, cache_size) on the first forward pass and store
+            them in a buffer (see `HashLookup`). Usually this is vocab_dim.
+        allow_oov: bool
+            Only used when cache_size is provided. If True, indices >=
+            cache_size are hashed on the fly (see `HashLookup`). Otherwise
+            they raise an error like nn.Embedding.
+        """
         super().__init__()
         # Must set n_blocks before computing v or e.
         self.n_blocks = n_blocks
         self.v = self._decompose_mult(vocab_dim)
         self.e = self._decompose_add(emb_dim)
         self.pre_hashed = pre_hashed
+        self.vectorized_hash = vectorized_hash
         # Must set emb blocks before defining process_fn.
         self.emb = nn.ModuleList(InitializedEmbedding(self.v, self.e, pad_idx)
                                  for _ in range(n_blocks))
         self.process_fn = identity if pre_hashed else \
-            partial(probabilistic_hash_tensor, n_buckets=self.v,
-                    n_hashes=len(self.emb), pad_idx=pad_idx)
+            HashLookup(self.v, len(self.emb), pad_idx,
+                       cache_size, vectorized_hash, allow_oov)
         # Makes interface consistent with nn.Embedding. Don't change name.
         self.embedding_dim = self.e * self.n_blocks
 
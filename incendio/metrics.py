@@ -1,9 +1,69 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: notebooks/03_metrics.ipynb (unless otherwise specified).
 
-__all__ = ['percent_positive', 'mean_soft_prediction', 'std_soft_prediction', 'batch_size']
+__all__ = ['accumulable', 'percent_positive', 'mean_soft_prediction', 'std_soft_prediction', 'batch_size', 'accuracy',
+           'precision', 'recall', 'MetricAccumulator']
 
 
 # Cell
+from collections import defaultdict
+import numpy as np
+import torch
+
+from htools import hasarg
+
+
+# Cell
+def accumulable(stats_fn, compute_fn):
+    """Decorator to mark a metric as accumulable. Instead of computing the
+    metric on each mini batch and averaging the results, the trainer can
+    then keep running sums of a few sufficient statistics on the device and
+    only compute the final value (which also means syncing with the device)
+    when it's actually needed. Metrics without these attributes (e.g. most
+    sklearn metrics) still work, they just take a slower path where each batch
+    is copied to the CPU.
+
+    Parameters
+    ----------
+    stats_fn: callable
+        Accepts the same (y_true, y_pred) or (y_true, y_score) args as the
+        metric itself and returns a 1D tensor of statistics that can be summed
+        across batches (e.g. number of correct predictions, number of
+        predictions). This should not move data off the device.
+    compute_fn: callable
+        Accepts the summed statistics tensor and returns the metric value.
+
+    Returns
+    -------
+    callable: Decorator that sets `stats_fn` and `compute_fn` attributes
+    on the metric function and returns it unchanged otherwise.
+    """
+    def decorator(func):
+        func.stats_fn = stats_fn
+        func.compute_fn = compute_fn
+        return func
+    return decorator
+
+
+def _count(x, n):
+    """Create a scalar tensor on the same device as x without syncing."""
+    return torch.full((), float(n), dtype=torch.float64, device=x.device)
+
+
+def _sum_and_count(x):
+    return torch.stack([x.sum().double(), _count(x, x.numel())])
+
+
+def _ratio(stats):
+    return stats[0] / stats[1]
+
+
+def _std(stats):
+    total, total_sq, n = stats
+    return ((total_sq - total**2 / n) / (n - 1)).clamp(min=0).sqrt()
+
+
+# Cell
+@accumulable(lambda y_true, y_pred: _sum_and_count(y_pred == 1), _ratio)
 def percent_positive(y_true, y_pred):
     """Compute the percent of predictions that are positive. This
     can help us identify when a model is predicting all ones or zeros.
@@ -12,23 +72,30 @@ def percent_positive(y_true, y_pred):
 
 
 # Cell
+@accumulable(lambda y_true, y_score: _sum_and_count(y_score), _ratio)
 def mean_soft_prediction(y_true, y_score):
     """Compute the mean predicted probability."""
     return y_score.mean()
 
 
 # Cell
+@accumulable(
+    lambda y_true, y_score: torch.stack([y_score.sum().double(),
+                                         (y_score.double()**2).sum(),
+                                         _count(y_score, y_score.numel())]),
+    _std
+)
 def std_soft_prediction(y_true, y_score):
     """Compute the standard deviation of the predicted
     probabilities. This helps us identify if the model is
     always predicting roughly the same probability.
 
-    Note: our standard aggregation method won't be strictly correct here
-    (aggregating standard deviations from multiple groups is more complex than
-    aggregating means) but it's usually not super important for this metric to
-    be precise: we typically just use it to debug a model that's been
-    outputting a particularly narrow range of values. incendio.lightning_utils
-    provides a torchmetric variant with the strictly correct computation.
+    Note: when used as a per-batch metric, our standard aggregation method
+    won't be strictly correct here (aggregating standard deviations from
+    multiple groups is more complex than aggregating means). Trainer uses the
+    accumulated sum and sum of squares instead, which gives the exact value
+    over the whole epoch. incendio.lightning_utils also provides a torchmetric
+    variant with the strictly correct computation.
     """
     return y_score.std()
 
@@ -36,4 +103,237 @@ def std_soft_prediction(y_true, y_score):
 # Cell
 def batch_size(y_true, y_pred):
     """Count the number of items in the current batch."""
-    return y_true.shape[0]
\ No newline at end of file
+    return y_true.shape[0]
+
+
+# Cell
+@accumulable(lambda y_true, y_pred: _sum_and_count(y_pred == y_true), _ratio)
+def accuracy(y_true, y_pred):
+    """Compute the percent of hard predictions that match the labels. Unlike
+    sklearn's accuracy_score, this can be accumulated on the device.
+    """
+    return (y_pred == y_true).float().mean()
+
+
+def _confusion_counts(y_true, y_pred):
+    """True positives, false positives, and false negatives for binary (or
+    multi-label) hard predictions.
+    """
+    y_true, y_pred = y_true == 1, y_pred == 1
+    return torch.stack([(y_true & y_pred).sum(), (~y_true & y_pred).sum(),
+                        (y_true & ~y_pred).sum()]).double()
+
+
+def _precision(counts):
+    tp, fp, _ = counts
+    return tp / (tp + fp).clamp(min=1)
+
+
+def _recall(counts):
+    tp, _, fn = counts
+    return tp / (tp + fn).clamp(min=1)
+
+
+@accumulable(_confusion_counts, _precision)
+def precision(y_true, y_pred):
+    """Binary precision. Unlike sklearn's precision_score, this can be
+    accumulated on the device. Returns 0 when there are no positive
+    predictions.
+    """
+    return _precision(_confusion_counts(y_true, y_pred))
+
+
+@accumulable(_confusion_counts, _recall)
+def recall(y_true, y_pred):
+    """Binary recall. Unlike sklearn's recall_score, this can be accumulated
+    on the device. Returns 0 when there are no positive labels.
+    """
+    return _recall(_confusion_counts(y_true, y_pred))
+
+
+# Cell
+class MetricAccumulator(dict):
+    """Tracks the loss and metrics over an epoch (or any number of batches).
+    Loss and accumulable metrics (see `accumulable`) are stored as running
+    sums on the same device as the predictions, so updating doesn't force a
+    device sync or a copy of the predictions. Other metrics are computed
+    on CPU copies of each batch and averaged, weighted by batch size, like
+    before.
+
+    Values are only materialized when calling `finalize` (which fills the
+    dict itself with {metric_name: float}) or `last`/`last_batch` (which
+    compute stats for the most recent batch). Reading from the dict itself
+    (e.g. `trainer.stats['loss']` in a callback) still works mid-epoch: it
+    lazily computes the running values over the batches seen so far (which
+    does sync with the device) and, until `finalize` is called, also includes
+    a 'batch_size' key containing the list of mini batch sizes.
+    """
+
+    def __init__(self, metrics=()):
+        """
+        Parameters
+        ----------
+        metrics: list[callable]
+            Metrics with a scikit-learn style interface (see module
+            docstring). We hold onto a reference so metrics that are added to
+            the list later on will be used after the next `clear`.
+            `batch_size` is ignored since batch sizes are always tracked.
+        """
+        super().__init__()
+        self.metrics = metrics
+        self.clear()
+
+    def clear(self):
+        """Reset all stats. Also checks for newly added metrics."""
+        super().clear()
+        self._metrics = [(m, m.__name__.replace('_score', ''),
+                          hasarg(m, 'y_pred'))
+                         for m in self.metrics if m is not batch_size]
+        self._name2metric = {name: m for m, name, _ in self._metrics}
+        self.sums = {}
+        self.last_stats = {}
+        self.batch_vals = defaultdict(list)
+        self.batch_sizes = []
+        self.finalized = False
+        self._n_synced = 0
+
+    def accumulate(self, loss, y_true, y_score, y_pred):
+        """Update stats with a single batch.
+
+        Parameters
+        ----------
+        loss: torch.Tensor
+            Tensor containing single value (mini-batch loss).
+        y_true: torch.Tensor
+            Mini-batch of labels.
+        y_score: torch.Tensor
+            Mini-batch of soft predictions (i.e. after the last activation).
+        y_pred: torch.Tensor
+            Mini-batch of hard predictions.
+        """
+        bs = y_true.shape[0]
+        batch = {'loss': torch.stack([loss.detach().double() * bs,
+                                      _count(loss, bs)])}
+        host = None
+        for m, name, use_pred in self._metrics:
+            y_hat = y_pred if use_pred else y_score
+            if hasattr(m, 'stats_fn'):
+                batch[name] = m.stats_fn(y_true, y_hat).double()
+                continue
+            # Slow path: only copy to CPU once per batch, and only if needed.
+            if host is None:
+                host = {'true': y_true.cpu(), 'score': y_score.cpu(),
+                        'pred': y_pred.cpu()}
+            self.batch_vals[name].append(
+                m(host['true'], host['pred' if use_pred else 'score'])
+            )
+        for k, v in batch.items():
+            self.sums[k] = self.sums[k] + v if k in self.sums else v
+        self.last_stats = batch
+        self.batch_sizes.append(bs)
+        self.finalized = False
+
+    def _compute(self, name, stats):
+        if name == 'loss': return _ratio(stats).item()
+        return self._name2metric[name].compute_fn(stats).item()
+
+    def last(self, name):
+        """Get the value of a single metric on the most recent batch.
+
+        Parameters
+        ----------
+        name: str
+            E.g. 'loss'.
+
+        Returns
+        -------
+        float or None: None if no batches have been seen yet.
+        """
+        if name in self.last_stats:
+            return self._compute(name, self.last_stats[name])
+        vals = self.batch_vals.get(name)
+        return float(vals[-1]) if vals else None
+
+    def last_batch(self):
+        """Get the value of each metric on the most recent batch.
+
+        Returns
+        -------
+        dict[str, float]
+        """
+        return {name: self.last(name)
+                for name in ['loss'] + [m[1] for m in self._metrics]}
+
+    def finalize(self):
+        """Compute the value of each metric over all batches seen since the
+        last `clear` and store them in the dict. This is where values are
+        finally pulled off the device. Calling this again without any new
+        batches is a no-op.
+
+        Returns
+        -------
+        MetricAccumulator: self, for convenience.
+        """
+        if self.finalized or not self.batch_sizes: return self
+        self._materialize()
+        self.finalized = True
+        return self
+
+    def _materialize(self, with_batch_size=False):
+        super().clear()
+        self['loss'] = self._compute('loss', self.sums['loss'])
+        for _, name, _ in self._metrics:
+            if name in self.sums:
+                self[name] = self._compute(name, self.sums[name])
+            else:
+                self[name] = np.average(self.batch_vals[name],
+                                        weights=self.batch_sizes)
+        if with_batch_size: self['batch_size'] = list(self.batch_sizes)
+        self._n_synced = len(self.batch_sizes)
+
+    def _sync(self):
+        """Lazily update the dict before reading from it (see class
+        docstring).
+        """
+        if not self.finalized and len(self.batch_sizes) != self._n_synced:
+            self._materialize(with_batch_size=True)
+
+    def __getitem__(self, key):
+        self._sync()
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        self._sync()
+        return super().__contains__(key)
+
+    def __iter__(self):
+        self._sync()
+        return super().__iter__()
+
+    def __len__(self):
+        self._sync()
+        return super().__len__()
+
+    def __repr__(self):
+        self._sync()
+        return super().__repr__()
+
+    def get(self, key, default=None):
+        self._sync()
+        return super().get(key, default)
+
+    def keys(self):
+        self._sync()
+        return super().keys()
+
+    def values(self):
+        self._sync()
+        return super().values()
+
+    def items(self):
+        self._sync()
+        return super().items()
+
+    def copy(self):
+        self._sync()
+        return dict(super().items())
\ No newline at end of file
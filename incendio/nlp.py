@@ -1,19 +1,25 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: notebooks/05_nlp.ipynb (unless otherwise specified).
 
-__all__ = ['tokenizer', 'tokenize', 'tokenize_many', 'Vocabulary', 'domain', 'domains_from_google_search', 'Embeddings',
-           'back_translate', 'postprocess_embeddings', 'compress_embeddings', 'ParaphraseTransform',
-           'GenerativeTransform', 'FillMaskTransform', 'NLP_TRANSFORMS', 'BacktranslateTransform', 'augment_text_df']
+__all__ = ['tokenizer', 'tokenize', 'tokenize_stream', 'tokenize_many', 'load_text_vectors', 'Vocabulary', 'domain',
+           'domains_from_google_search', 'IVFIndex', 'Embeddings', 'back_translate', 'postprocess_embeddings',
+           'compress_embeddings', 'ParaphraseTransform', 'GenerativeTransform', 'FillMaskTransform', 'NLP_TRANSFORMS',
+           'BacktranslateTransform', 'AugmentationCache', 'CachedTransform', 'augment_text_df']
 
 
 # Cell
 from bs4 import BeautifulSoup
-from collections import Counter
-from collections.abc import Iterable
+from collections import Counter, deque
+from collections.abc import Iterable, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
+from itertools import islice
+import hashlib
+import json
 from multipledispatch import dispatch
 import multiprocessing
 import numpy as np
 import os
+from packaging import version
 import pandas as pd
 from pathlib import Path
 import re
@@ -21,20 +27,25 @@ import requests
 from sklearn.decomposition import PCA
 from sklearn.utils.validation import check_is_fitted
 import spacy
+import sqlite3
+import tempfile
 from textblob import TextBlob
+from threadpoolctl import threadpool_limits
 import torch
 from tqdm.auto import tqdm
+import transformers
 from transformers import PegasusForConditionalGeneration, PegasusTokenizer, \
     PegasusTokenizerFast, Text2TextGenerationPipeline, \
     AutoModelForSeq2SeqLM, AutoTokenizer, TranslationPipeline, pipeline
 from tldextract import extract
+import time
 from transformers.modeling_utils import PreTrainedModel
 import warnings
 import wordninja as wn
 
 from htools import save, load, add_docstring, tolist, auto_repr, listlike, \
     flatten, immutify_defaults, ifnone, item, lmap, func_name, valuecheck
-from .utils import DEVICE
+from .utils import DEVICE, reproducible
 
 
 # Cell
@@ -64,15 +75,98 @@ def tokenize(text, nlp):
 
 
 # Cell
-def tokenize_many(rows, nlp=None, chunk=1_000):
+def _batched(items, size):
+    """Yield lists of up to `size` items from any iterable."""
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch: return
+        yield batch
+
+
+# Each tokenize_stream worker process loads its own tokenizer once.
+_worker_nlp = None
+
+
+def _init_tokenize_worker(nlp=None):
+    global _worker_nlp
+    _worker_nlp = nlp or tokenizer()
+
+
+def _tokenize_batch(texts, batch_size, nlp=None):
+    nlp = nlp or _worker_nlp
+    return [[tok.text for tok in doc]
+            for doc in nlp.pipe(texts, batch_size=batch_size)]
+
+
+def tokenize_stream(rows, nlp=None, chunk=1_000, batch_size=256,
+                    n_workers=None, max_pending=None):
+    """Lazily word tokenize any iterable of strings using multiprocessing,
+    yielding results in the same order as the inputs. Each worker loads its
+    own spacy tokenizer once and processes a chunk of rows at a time with
+    `nlp.pipe`. At most `max_pending` chunks are in flight at once, so memory
+    usage is bounded even for corpora that don't fit in memory (e.g. lines
+    streamed from a file).
+
+    Parameters
+    ----------
+    rows: Iterable[str]
+        Strings to tokenize. This can be a generator.
+    nlp: spacy tokenizer, e.g. spacy.lang.en.English
+        If None, each worker loads the default tokenizer (a spacy tokenizer
+        with a small English vocabulary with NER, parsing, and tagging
+        disabled). If provided, it's sent to each worker once.
+    chunk: int
+        Number of rows sent to a worker at a time.
+    batch_size: int
+        Batch size for `nlp.pipe` within each chunk.
+    n_workers: int or None
+        Number of processes. None uses all available cores. If 1, rows are
+        tokenized in the current process.
+    max_pending: int or None
+        Max number of chunks submitted but not yet yielded. Defaults to
+        2*n_workers, which keeps all workers busy.
+
+    Yields
+    ------
+    list[str]: Word tokens for one input string.
+    """
+    n_workers = n_workers or os.cpu_count()
+    max_pending = max_pending or 2 * n_workers
+    batches = _batched(rows, chunk)
+    if n_workers == 1:
+        nlp = nlp or tokenizer()
+        for batch in batches:
+            yield from _tokenize_batch(batch, batch_size, nlp)
+        return
+
+    pool = multiprocessing.Pool(n_workers, _init_tokenize_worker, (nlp,))
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append(pool.apply_async(_tokenize_batch,
+                                            (batch, batch_size)))
+            if len(pending) >= max_pending:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def tokenize_many(rows, nlp=None, chunk=1_000, batch_size=256,
+                  n_workers=None, out_dir=None, shard_size=100_000):
     """Word tokenize a sequence of strings using multiprocessing. The max
-    number of available processes are used.
+    number of available processes are used by default. This is a wrapper
+    around `tokenize_stream` that either collects the results in a list or
+    writes them to sharded files.
 
     Parameters
     ----------
     rows: Iterable[str]
         A sequence of strings to tokenize. This could be a list, a column of
-        a DataFrame, etc.
+        a DataFrame, a generator, etc.
     nlp: spacy tokenizer, e.g. spacy.lang.en.English
         By default, a spacy tokenizer with a small English vocabulary
         is used. NER, parsing, and tagging are disabled. Any spacy
@@ -84,25 +178,367 @@ def tokenize_many(rows, nlp=None, chunk=1_000):
         long pieces of text and memory is limited, you can always decrease it.
         Very small chunk sizes may increase processing time. Note that larger
         values will generally cause the progress bar to update more choppily.
+    batch_size: int
+        Batch size for `nlp.pipe`.
+    n_workers: int or None
+        Number of processes. None uses all available cores.
+    out_dir: str, Path, or None
+        If provided, results are written to this directory instead of being
+        returned, in files named tokens_00000.jsonl, tokens_00001.jsonl, etc.
+        Each line is a json list of tokens for one input row and the
+        rows are in input order.
+    shard_size: int
+        Number of rows per output file when out_dir is provided.
 
     Returns
     -------
-    list[list[str]]: Each nested list of word tokens corresponds to one
-    of the input strings.
+    list[list[str]] or list[Path]: Each nested list of word tokens
+    corresponds to one of the input strings. If out_dir is provided, we
+    return the paths of the shard files instead.
     """
-    tokenize_ = partial(tokenize, nlp=nlp or tokenizer())
-    length = len(rows)
-    with multiprocessing.Pool() as p:
-        res = list(tqdm(p.imap(tokenize_, rows, chunksize=chunk),
-                        total=length))
-    return res
+    tokens = tqdm(tokenize_stream(rows, nlp, chunk, batch_size, n_workers),
+                  total=len(rows) if hasattr(rows, '__len__') else None)
+    if out_dir is None: return list(tokens)
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i, shard in enumerate(_batched(tokens, shard_size)):
+        paths.append(Path(out_dir)/f'tokens_{i:05}.jsonl')
+        with open(paths[-1], 'w') as f:
+            f.writelines(json.dumps(toks) + '\n' for toks in shard)
+    return paths
+
+
+# Cell
+def _vector_file_ranges(path, chunk_bytes, start=0):
+    """Split a file (starting at byte `start`) into byte ranges of roughly
+    `chunk_bytes` that always end on a line boundary.
+    """
+    size = os.path.getsize(path)
+    bounds = [start]
+    with open(path, 'rb') as f:
+        while bounds[-1] < size:
+            f.seek(min(bounds[-1] + chunk_bytes, size))
+            f.readline()
+            bounds.append(f.tell())
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _read_lines(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return [line for line in f.read(end - start).splitlines()
+                if line.strip()]
+
+
+def _parse_vector_chunk(args):
+    """Parse the lines in a byte range of a GloVe/word2vec style text file.
+
+    Parameters
+    ----------
+    args: tuple
+        path, start byte, end byte, embedding dimension, dtype. (Bundled into
+        one arg for multiprocessing.)
+
+    Returns
+    -------
+    tuple[list[str], np.array]: Words and a matrix with one row per word.
+    """
+    path, start, end, dim, dtype = args
+    lines = _read_lines(path, start, end)
+    words, rests = zip(*(line.rstrip().split(b' ', 1) for line in lines)) \
+        if lines else ((), ())
+    # Parsing one big space-separated string happens entirely in C, unlike
+    # np.loadtxt on older versions of numpy. float16 isn't supported here.
+    with warnings.catch_warnings():
+        # Numpy warns when it can't parse the whole string. We check below.
+        warnings.simplefilter('ignore', DeprecationWarning)
+        vecs = np.fromstring(b' '.join(rests),
+                             dtype=np.result_type(dtype, np.float32),
+                             sep=' ')
+    if vecs.size != len(lines) * dim:
+        # Some files (e.g. GloVe 840B) contain words with spaces in them.
+        # Fall back to splitting from the right, which is slower.
+        parts = [line.rstrip().rsplit(b' ', dim) for line in lines]
+        words = [b' '.join(p[:-dim]) for p in parts]
+        if any(len(p) != dim + 1 for p in parts):
+            raise ValueError(f'Expected {dim}-dimensional vectors in '
+                             f'bytes {start}-{end} of {path}.')
+        vecs = np.array([p[-dim:] for p in parts], dtype=dtype)
+    return [w.decode('utf-8', errors='replace') for w in words], \
+        vecs.reshape(len(lines), dim).astype(dtype, copy=False)
+
+
+def load_text_vectors(path, max_words=float('inf'), dtype=np.float32,
+                      n_workers=None, chunk_bytes=2**24, offset=0,
+                      verbose=True):
+    """Load word vectors from a GloVe-style text file (each line contains a
+    word followed by its space-separated vector) or a word2vec text file
+    (same thing plus a header line with the number of words and the
+    dimension). The file is split into byte ranges that are parsed in
+    parallel (in a single pass over the file), so this is much faster than
+    parsing line by line.
+
+    Unless the file fits in a single chunk, vectors are appended to a scratch
+    file next to `path` (or in the system's temp directory if that isn't
+    writable) and we return a memmap of it instead of reading it back into
+    memory, so peak memory stays at a few chunks even when /tmp is held in
+    memory. On POSIX systems, the scratch file is deleted right away and its
+    disk space is freed once the memmap is garbage collected. Use
+    np.array(mat) if you need an in-memory copy.
+
+    Parameters
+    ----------
+    path: str or Path
+        Text file containing word vectors.
+    max_words: int or float
+        Maximum number of words to read (the first max_words lines).
+    dtype: type
+        Dtype of the output matrix.
+    n_workers: int or None
+        Number of processes used to parse the file. None uses all available
+        cores. Small files (a single chunk) are always parsed in the current
+        process.
+    chunk_bytes: int
+        Approximate size of each byte range.
+    offset: int
+        Number of rows of zeros to leave at the start of the output matrix
+        (e.g. for padding and unknown tokens) so we don't need to copy it
+        later to add them.
+    verbose: bool
+        If True, show a progress bar (updated once per chunk).
+
+    Returns
+    -------
+    tuple[list[str], np.array]: Words and matrix (np.memmap for files larger
+    than `chunk_bytes`) where row i+offset is the vector for word i.
+    """
+    with open(path, 'rb') as f:
+        first = f.readline()
+        header = first.split()
+        if len(header) == 2 and all(x.isdigit() for x in header):
+            start = len(first)
+            dim = int(header[1])
+        else:
+            start = 0
+            dim = len(header) - 1
+    args = [(path, lo, hi, dim, dtype) for lo, hi in
+            _vector_file_ranges(path, chunk_bytes, start)]
+    if len(args) == 1:
+        words, vecs = _parse_vector_chunk(args[0])
+        n = int(min(len(words), max_words))
+        mat = np.zeros((offset + n, dim), dtype=dtype)
+        mat[offset:] = vecs[:n]
+        return words[:n], mat
+
+    # Chunks are parsed in order, so we just append each one to the scratch
+    # file and stop as soon as we have enough words.
+    try:
+        fd, scratch = tempfile.mkstemp(
+            prefix=f'.{os.path.basename(path)}.', suffix='.tmp',
+            dir=os.path.dirname(os.path.abspath(path))
+        )
+    except OSError:
+        fd, scratch = tempfile.mkstemp(suffix='.tmp')
+    pool = multiprocessing.Pool(n_workers) if n_workers != 1 else None
+    map_ = pool.imap if pool else map
+    words = []
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(np.zeros((offset, dim), dtype=dtype).tobytes())
+            for chunk_words, vecs in tqdm(map_(_parse_vector_chunk, args),
+                                          total=len(args),
+                                          disable=not verbose):
+                n = int(min(len(chunk_words), max_words - len(words)))
+                words.extend(chunk_words[:n])
+                f.write(vecs[:n].tobytes())
+                if len(words) >= max_words: break
+        shape = (offset + len(words), dim)
+        # Numpy can't memory-map an empty file.
+        mat = np.memmap(scratch, dtype=dtype, mode='r+', shape=shape) \
+            if shape[0] else np.zeros(shape, dtype=dtype)
+        # Windows can't delete a file while it's memory-mapped.
+        if os.name == 'nt': mat = np.array(mat)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+        os.remove(scratch)
+    return words, mat
+
+
+# Cell
+class _KeyTable(Sequence):
+    """Read-only list of strings stored as one concatenated UTF-8 blob plus
+    an array of offsets (key i is blob[offsets[i]:offsets[i+1]]). Both can be
+    memory-mapped so opening a huge vocabulary doesn't require creating
+    millions of python strings up front.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0: i += len(self)
+        return bytes(self.blob[self.offsets[i]:self.offsets[i+1]]) \
+            .decode('utf-8')
+
+    def __iter__(self):
+        # Decode in one pass rather than slicing the memmap once per key.
+        data = bytes(self.blob)
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield data[start:end].decode('utf-8')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __eq__(self, obj):
+        return isinstance(obj, (list, _KeyTable)) and list(self) == list(obj)
+
+    def __repr__(self):
+        return f'_KeyTable(len={len(self)})'
+
+
+class _KeyIndex(Mapping):
+    """Lazily built key -> index mapping for a _KeyTable. The underlying dict
+    is only created the first time we look up a key.
+    """
+
+    def __init__(self, keys):
+        self.keys_ = keys
+        self._w2i = None
+
+    @property
+    def w2i(self):
+        if self._w2i is None:
+            self._w2i = {k: i for i, k in enumerate(self.keys_)}
+        return self._w2i
+
+    def __getitem__(self, key):
+        return self.w2i[key]
+
+    def __iter__(self):
+        return iter(self.w2i)
+
+    def __len__(self):
+        return len(self.keys_)
+
+    def __repr__(self):
+        return f'_KeyIndex(len={len(self)})'
+
+
+def _save_binary(path, keys, mat=None, meta=None, extras=None, dtype=None,
+                 verbose=True):
+    """Save keys and an (optional) matrix to a directory that can later be
+    opened with `_load_binary`. Layout:
+
+    meta.json: small metadata header (format version, shape, dtype, etc.)
+    mat.npy: raw matrix in the requested dtype (loadable with np.memmap)
+    keys.bin, key_offsets.npy: concatenated UTF-8 keys and their offsets
+    extras.pkl: anything else that needs pickling (e.g. a fitted PCA)
+
+    Parameters
+    ----------
+    path: str or Path
+        Directory to create.
+    keys: Iterable[str]
+        Key i corresponds to row i of mat.
+    mat: np.array or None
+    meta: dict or None
+        Additional json-serializable metadata.
+    extras: dict or None
+        Additional objects to pickle.
+    dtype: str or None
+        If provided, mat is cast to this dtype before saving (e.g. 'float16'
+        to halve the storage of a float32 matrix).
+    verbose: bool
+    """
+    path = Path(path)
+    os.makedirs(path, exist_ok=True)
+    blobs = [key.encode('utf-8') for key in keys]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in blobs], out=offsets[1:])
+    (path/'keys.bin').write_bytes(b''.join(blobs))
+    np.save(path/'key_offsets.npy', offsets)
+    meta = {'version': 1, 'n_keys': len(blobs), **(meta or {})}
+    if mat is not None:
+        mat = np.asarray(mat, dtype=dtype)
+        np.save(path/'mat.npy', mat)
+        meta.update(shape=mat.shape, dtype=str(mat.dtype))
+    save(meta, path/'meta.json', verbose=False)
+    if extras: save(extras, path/'extras.pkl', verbose=False)
+    if verbose: print(f'Writing data to {path}.')
+
+
+def _load_binary(path, mmap=True):
+    """Load data written by `_save_binary`.
+
+    Parameters
+    ----------
+    path: str or Path
+        Directory created by `_save_binary`.
+    mmap: bool
+        If True, the matrix and keys are memory-mapped (read-only) rather than
+        read into memory. This makes loading nearly instant and lets multiple
+        processes share the same pages.
+
+    Returns
+    -------
+    tuple: mat (np.array or None), keys (_KeyTable), meta (dict), extras
+    (dict).
+    """
+    path = Path(path)
+    meta = load(path/'meta.json', verbose=False)
+    mmap_mode = 'r' if mmap else None
+    mat = np.load(path/'mat.npy', mmap_mode=mmap_mode) \
+        if (path/'mat.npy').exists() else None
+    offsets = np.load(path/'key_offsets.npy')
+    # Can't memory-map an empty file.
+    if mmap and offsets[-1] > 0:
+        blob = np.memmap(path/'keys.bin', dtype=np.uint8, mode='r')
+    else:
+        blob = (path/'keys.bin').read_bytes()
+    extras = load(path/'extras.pkl', verbose=False) \
+        if (path/'extras.pkl').exists() else {}
+    return mat, _KeyTable(blob, offsets), meta, extras
+
+
+# Cell
+class _VectorView(Mapping):
+    """Read-only word -> vector mapping backed by a Vocabulary's `vectors`
+    matrix. This lets `vocab.w2vec` keep working like the dict it used to be
+    without storing a separate array for each word. Like before, it only
+    contains words that were given a vector (plus '<UNK>').
+    """
+
+    def __init__(self, vocab):
+        self.vocab = vocab
+
+    def __getitem__(self, word):
+        idx = self.vocab.w2idx[word]
+        if not self.vocab._has_vec[idx]: raise KeyError(word)
+        return self.vocab.vectors[idx]
+
+    def __iter__(self):
+        has_vec = self.vocab._has_vec
+        return (w for w, i in self.vocab.w2idx.items() if has_vec[i])
+
+    def __len__(self):
+        return int(self.vocab._has_vec.sum())
+
+    def __repr__(self):
+        return f'_VectorView(len={len(self)})'
 
 
 # Cell
 class Vocabulary:
 
     def __init__(self, w2idx, w2vec=None, idx_misc=None, corpus_counts=None,
-                 all_lower=True):
+                 all_lower=True, vectors=None):
         """Defines a vocabulary object for NLP problems, allowing users to
         encode text with indices or embeddings.
 
@@ -115,7 +551,9 @@ class Vocabulary:
             a longer idx_misc is passed in, the minimum index would be larger.
         w2vec: dict[str, np.array]
             Dictionary mapping words to their embedding vectors stored as
-            numpy arrays (optional).
+            numpy arrays (optional). These are copied into a single matrix
+            (see `vectors`). Words with no vector get a vector of zeros, and
+            vectors for words that aren't in w2idx are ignored.
         idx_misc: dict
             A dictionary mapping non-word tokens to indices. If none is passed
             in, a default version will be used with keys for unknown tokens
@@ -129,6 +567,10 @@ class Vocabulary:
             all lowercase. Note that this will NOT change any of this data. If
             True, it simply lowercases user-input words when looking up their
             index or vector.
+        vectors: np.array
+            Alternative to w2vec: a matrix where row i is the embedding of the
+            word with index i (rows for the idx_misc tokens should be zeros).
+            This is used as is (no copy) so it can be a view or a memmap.
         """
         if not idx_misc:
             idx_misc = {'<PAD>': 0,
@@ -141,20 +583,66 @@ class Vocabulary:
         self.w2idx = {**self.idx_misc, **w2idx}
         self.i2w = [word for word, idx in sorted(self.w2idx.items(),
                                                  key=lambda x: x[1])]
-        self.w2vec = w2vec or dict()
+        # Sets "vectors", "dim", and "_has_vec" attributes.
+        self._set_vectors(w2vec, vectors)
 
         # Miscellaneous other attributes.
-        if w2vec:
-            self.dim = len(w2vec[self[-1]])
-        else:
-            self.dim = 1
         self.corpus_counts = corpus_counts
         self.embedding_matrix = None
-        self.w2vec['<UNK>'] = np.zeros(self.dim)
         self.all_lower = all_lower
 
+    def _set_vectors(self, w2vec=None, vectors=None):
+        """Store embeddings in a single matrix where row i corresponds to the
+        word with index i. `_has_vec` tracks which rows came from an actual
+        embedding so `w2vec` contains the same keys it used to.
+
+        Parameters
+        ----------
+        w2vec: dict[str, np.array] or None
+        vectors: np.array or None
+        """
+        n_rows = max(self.w2idx.values()) + 1
+        if vectors is not None:
+            has_vec = np.ones(n_rows, dtype=bool)
+            has_vec[list(self.idx_misc.values())] = False
+        elif w2vec:
+            first = next(iter(w2vec.values()))
+            vectors = np.zeros((n_rows, len(first)),
+                               dtype=np.asarray(first).dtype)
+            has_vec = np.zeros(n_rows, dtype=bool)
+            for word, i in self.w2idx.items():
+                if word in w2vec and word not in self.idx_misc:
+                    vectors[i] = w2vec[word]
+                    has_vec[i] = True
+        else:
+            vectors = np.zeros((n_rows, 1))
+            has_vec = np.zeros(n_rows, dtype=bool)
+        # Unknown tokens get a vector of zeros.
+        has_vec[self.w2idx['<UNK>']] = True
+        self.vectors = vectors
+        self.dim = vectors.shape[1]
+        self._has_vec = has_vec
+
+    @property
+    def w2vec(self):
+        """Mapping from word to embedding vector. This is a view of
+        `self.vectors`, not a copy.
+        """
+        return _VectorView(self)
+
+    @w2vec.setter
+    def w2vec(self, w2vec):
+        self._set_vectors(w2vec)
+
+    def __setstate__(self, state):
+        # Vocabularies pickled before vectors were stored as a matrix.
+        w2vec = state.pop('w2vec', None)
+        self.__dict__.update(state)
+        if w2vec is not None: self._set_vectors(w2vec)
+
     @classmethod
-    def from_glove_file(cls, path, max_lines=float('inf'), idx_misc=None):
+    def from_glove_file(cls, path, max_lines=float('inf'), idx_misc=None,
+                        dtype=np.float32, n_workers=None):
         """Create a new Vocabulary object by loading GloVe vectors from a text
         file. The embeddings are all lowercase so the user does not have the
         option to set the all_lower parameter.
@@ -169,20 +657,19 @@ class Vocabulary:
             all 400,000 lines in the file will be read in.
         idx_misc: dict
             Map non-standard tokens to indices. See constructor docstring.
+        dtype: type
+            Dtype of the loaded vectors.
+        n_workers: int or None
+            Number of processes used to parse the file (see
+            `load_text_vectors`).
         """
-        w2idx = dict()
-        w2vec = dict()
         misc_len = 2 if not idx_misc else len(idx_misc)
-
-        with open(path, 'r') as f:
-            for i, line in enumerate(f):
-                if i >= max_lines:
-                    break
-                word, *values = line.strip().split(' ')
-                w2idx[word] = i + misc_len
-                w2vec[word] = np.array(values, dtype=np.float)
-
-        return cls(w2idx, w2vec, idx_misc)
+        # Leave empty rows for the misc tokens so we can use the loaded
+        # matrix as is.
+        words, mat = load_text_vectors(path, max_lines, dtype, n_workers,
+                                       offset=misc_len)
+        w2idx = {word: i for i, word in enumerate(words, misc_len)}
+        return cls(w2idx, idx_misc=idx_misc, vectors=mat)
 
     @classmethod
     def from_tokens(cls, tokens, idx_misc=None, all_lower=True):
@@ -223,7 +710,49 @@ class Vocabulary:
         """
         return load(path)
 
-    def save(self, path, verbose=True):
+    @classmethod
+    def open(cls, path, mmap=True):
+        """Load a Vocabulary saved with `save(path, binary=True)`. The
+        embedding vectors are memory-mapped by default, so this is much faster
+        and lighter than unpickling. Like `Embeddings.open`, this skips the
+        constructor and the word -> index dict is only built the first time
+        it's needed. Pickle files are also accepted and loaded with
+        `from_pickle`.
+
+        Parameters
+        -----------
+        path: str
+            Directory created by `save` (or a pickle file).
+        mmap: bool
+            If True, memory-map the vectors rather than reading them into
+            memory.
+
+        Returns
+        --------
+        Vocabulary
+        """
+        if Path(path).is_file(): return cls.from_pickle(path)
+        mat, keys, meta, extras = _load_binary(path, mmap)
+        vocab = cls.__new__(cls)
+        vocab.idx_misc = meta['idx_misc']
+        # Keys were saved in index order.
+        vocab.w2idx = _KeyIndex(keys)
+        vocab.i2w = keys
+        if mat is None:
+            vocab.vectors = np.zeros((len(keys), 1))
+            vocab._has_vec = np.zeros(len(keys), dtype=bool)
+        else:
+            vocab.vectors = mat
+            vocab._has_vec = np.ones(len(keys), dtype=bool)
+            vocab._has_vec[list(vocab.idx_misc.values())] = False
+        vocab._has_vec[vocab.idx_misc['<UNK>']] = True
+        vocab.dim = vocab.vectors.shape[1]
+        vocab.corpus_counts = extras.get('corpus_counts')
+        vocab.embedding_matrix = None
+        vocab.all_lower = meta['all_lower']
+        return vocab
+
+    def save(self, path, verbose=True, binary=False, dtype=None):
         """Pickle Vocabulary object for later use. We can then quickly load
         the object using torch.load(path), which can be much faster than
         re-computing everything when the vocab size becomes large.
@@ -234,8 +763,26 @@ class Vocabulary:
             Where to save the output file.
         verbose: bool
             If True, print message showing where the object was saved to.
+        binary: bool
+            If True, `path` is treated as a directory and we save the
+            vocabulary in a binary format (see `_save_binary`) instead of
+            pickling it. Load it with `Vocabulary.open`, which memory-maps
+            the embedding matrix.
+        dtype: str or None
+            Only used when binary=True. Lets us store the embedding matrix
+            with a different dtype, e.g. 'float32'.
         """
-        save(self, path, verbose)
+        if not binary: return save(self, path, verbose=verbose)
+        # Vocabularies built from tokens only have the placeholder <UNK>
+        # vector.
+        has_vectors = self._has_vec.sum() > 1
+        _save_binary(
+            path, self.i2w, self.vectors if has_vectors else None,
+            meta={'idx_misc': self.idx_misc, 'all_lower': self.all_lower},
+            extras={'corpus_counts': self.corpus_counts}
+            if self.corpus_counts else None,
+            dtype=dtype, verbose=verbose
+        )
 
     def filter_tokens(self, tokens, max_words=None, min_freq=0, inplace=False,
                       recompute=False):
@@ -264,7 +811,11 @@ class Vocabulary:
             the vocabulary will be performed.
         inplace: bool
             If True, will change the object's attributes
-            (w2idx, w2vec, and i2w) to reflect the newly filtered vocabulary.
+            (w2idx, vectors, and i2w) to reflect the newly filtered
+            vocabulary. If the kept words are a prefix of the current
+            vocabulary (e.g. it was already sorted by frequency), the new
+            vectors are a view of the old ones. Otherwise, the needed rows
+            are copied with a single fancy indexing operation.
             If False, will not change the object, but will simply compute word
             counts and return what the new w2idx would be. This can be helpful
             for experimentation, as we may want to try out multiple values of
@@ -298,9 +849,13 @@ class Vocabulary:
 
         if inplace:
             # Relies on python3.7 dicts retaining insertion order.
+            rows = np.array([self.idx(word) for word in filtered])
+            if (rows == np.arange(len(rows))).all():
+                rows = slice(len(rows))
+            self.vectors = self.vectors[rows]
+            self._has_vec = self._has_vec[rows]
             self.i2w = list(filtered.keys())
             self.w2idx = filtered
-            self.w2vec = {word: self.vector(word) for word in filtered}
         else:
             return filtered
 
@@ -319,11 +874,14 @@ class Vocabulary:
             in another variable which we can use to initialize the weights in
             Torch, then delete the object and free up memory using
             gc.collect().
-        """
-        emb = np.zeros((len(self), self.dim))
-        for i, word in enumerate(self):
-            emb[i] = self.vector(word)
 
+        Returns
+        --------
+        np.array or None: This is `self.vectors` itself (not a copy), so
+        copy it first if you need to modify it without affecting the
+        vocabulary.
+        """
+        emb = self.vectors
         if inplace:
             self.embedding_matrix = emb
         else:
@@ -365,9 +923,8 @@ class Vocabulary:
         --------
         np.array
         """
-        if self.all_lower and word not in self.idx_misc:
-            word = word.lower()
-        return self.w2vec.get(word, self.w2vec['<UNK>'])
+        # Words without an embedding have a row of zeros, same as <UNK>.
+        return self.vectors[self.idx(word)]
 
     def encode(self, text, nlp, max_len, pad_end=True, trim_start=True):
         """Encode text so that each token is replaced by its integer index in
@@ -413,6 +970,81 @@ class Vocabulary:
             output[max_len-len(encoded):] = encoded
         return output.astype(int)
 
+    def encode_many(self, texts, nlp, max_len, pad_end=True, trim_start=True,
+                    batch_size=1_000, n_process=1, out=None, dtype=np.int32):
+        """Bulk version of `encode`. Texts are streamed through `nlp.pipe` in
+        batches, token lookups are cached (so each distinct token is only
+        lowercased and looked up once), and results are written into a single
+        preallocated array. This is much faster than calling `encode` on each
+        text.
+
+        Parameters
+        -----------
+        texts: Iterable[str]
+            Raw texts to encode. If this doesn't have a length (e.g. a
+            generator), it will be converted to a list first.
+        nlp: spacy.lang.en.English
+            Spacy tokenizer. See `encode`.
+        max_len: int
+            Length of each output row. See `encode`.
+        pad_end: bool
+            If True, add padding to the end of short sentences. If False, pad
+            the start of these sentences.
+        trim_start: bool
+            If True, trim off the start of sentences that are too long. If
+            False, trim off the end.
+        batch_size: int
+            Number of texts spacy processes at a time.
+        n_process: int
+            Number of processes spacy uses. Since we only tokenize, this is
+            mostly worth increasing for very large corpora.
+        out: str, Path, or None
+            If provided, the output is written to a memory-mapped .npy file at
+            this path (useful when the encoded corpus doesn't fit in memory).
+            The file can be loaded later with np.load(out, mmap_mode='r').
+        dtype: type
+            Integer dtype of the output.
+
+        Returns
+        --------
+        np.array: Shape (len(texts), max_len) where row i contains the word
+            indices of texts[i].
+        """
+        if not hasattr(texts, '__len__'): texts = list(texts)
+        pad = self.idx('<PAD>')
+        shape = (len(texts), max_len)
+        if out is None:
+            output = np.full(shape, pad, dtype=dtype)
+        else:
+            output = np.lib.format.open_memmap(out, mode='w+', dtype=dtype,
+                                               shape=shape)
+            output[:] = pad
+
+        tok2idx = {}
+        for i, doc in enumerate(nlp.pipe(texts, batch_size=batch_size,
+                                         n_process=n_process)):
+            encoded = []
+            for tok in doc:
+                idx = tok2idx.get(tok.text)
+                if idx is None:
+                    idx = tok2idx[tok.text] = self.idx(tok.text)
+                encoded.append(idx)
+
+            # Trim sentence in case it's longer than max_len.
+            if len(encoded) > max_len:
+                if trim_start:
+                    encoded = encoded[len(encoded) - max_len:]
+                else:
+                    encoded = encoded[:max_len]
+
+            # Replace padding at start or end, depending on choice of pad_end.
+            if pad_end:
+                output[i, :len(encoded)] = encoded
+            else:
+                output[i, max_len-len(encoded):] = encoded
+        if out is not None: output.flush()
+        return output
+
     def decode(self, idx, join=True, sep=' '):
         """Convert a list of indices to a string or list of words/tokens.
 
@@ -474,7 +1106,7 @@ class Vocabulary:
         if not isinstance(obj, Vocabulary):
             return False
 
-        ignore = {'w2vec', 'embedding_matrix'}
+        ignore = {'vectors', '_has_vec', 'embedding_matrix'}
         attrs = [k for k, v in hdir(vocab).items()
                  if v == 'attribute' and k not in ignore]
         return all([getattr(self, attr) == getattr(obj, attr)
@@ -525,6 +1157,155 @@ def domains_from_google_search(term, drop_probable_defaults=True):
     return list(domains)
 
 
+# Cell
+class IVFIndex:
+    """Approximate nearest neighbor index for Embeddings using an inverted
+    file (IVF): vectors are clustered with k-means and at query time we only
+    compute exact distances to vectors in the `nprobe` clusters whose
+    centroids are closest to the query. This is pure numpy and meant for
+    interactive use on very large vocabularies (e.g. millions of domains),
+    where exact search over the whole matrix gets slow. Usually you'll create
+    one via `Embeddings.build_index` rather than directly.
+    """
+
+    @valuecheck
+    def __init__(self, n_clusters=None, nprobe=8,
+                 distance:('cosine', 'euclidean')='cosine', n_iter=10,
+                 sample_size=100_000, seed=0):
+        """
+        Parameters
+        ----------
+        n_clusters: int or None
+            Number of k-means clusters. If None, we use roughly 4*sqrt(n)
+            where n is the number of vectors.
+        nprobe: int
+            Number of clusters to search for each query. This is the main
+            recall/latency knob: higher values are slower but more accurate
+            and nprobe=n_clusters is equivalent to exact search. It can be
+            changed after fitting.
+        distance: str
+            Distance used to build the index ('cosine' or 'euclidean').
+            Queries using a different distance fall back to exact search.
+        n_iter: int
+            Number of k-means iterations.
+        sample_size: int
+            K-means is fit on a random sample of at most this many vectors.
+            All vectors are still assigned to a cluster afterwards.
+        seed: int
+            Random seed for sampling and centroid initialization.
+        """
+        self.n_clusters = n_clusters
+        self.nprobe = nprobe
+        self.distance = distance
+        self.n_iter = n_iter
+        self.sample_size = sample_size
+        self.seed = seed
+        self.centroids = None
+        # Recall@n measured against exact search (see
+        # `Embeddings.index_recall`).
+        self.recall = None
+
+    def _prep(self, vecs):
+        vecs = np.atleast_2d(vecs).astype(np.float32)
+        if self.distance == 'cosine':
+            norms = Embeddings.norm(vecs)
+            vecs = vecs / np.where(norms == 0, 1, norms)[:, None]
+        return vecs
+
+    def _centroid_dists(self, vecs):
+        """Score each (already prepped) vector against each centroid. Lower
+        is closer, but these aren't true distances (constant terms are
+        dropped).
+        """
+        sims = vecs @ self.centroids.T
+        if self.distance == 'cosine':
+            return -sims
+        return np.sum(self.centroids ** 2, axis=-1) - 2 * sims
+
+    def _assign(self, vecs, chunk_size=65_536):
+        return np.concatenate([
+            self._centroid_dists(vecs[i:i+chunk_size]).argmin(axis=1)
+            for i in range(0, len(vecs), chunk_size)
+        ])
+
+    def fit(self, mat):
+        """Cluster the embedding matrix and build the inverted lists.
+
+        Parameters
+        ----------
+        mat: np.array
+            Shape (n_embeddings, dim).
+
+        Returns
+        -------
+        IVFIndex: self, for convenience.
+        """
+        vecs = self._prep(mat)
+        n = len(vecs)
+        rng = np.random.default_rng(self.seed)
+        sample = vecs[rng.choice(n, min(n, self.sample_size), replace=False)]
+        k = min(self.n_clusters or int(4 * np.sqrt(n)), len(sample))
+        self.centroids = sample[rng.choice(len(sample), k, replace=False)]
+        for _ in range(self.n_iter):
+            labels = self._assign(sample)
+            counts = np.bincount(labels, minlength=k)
+            # Sum vectors per cluster by sorting them by label (much faster
+            # than np.add.at).
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            empty = counts == 0
+            sums = np.zeros_like(self.centroids)
+            sums[~empty] = np.add.reduceat(
+                sample[np.argsort(labels, kind='stable')], starts[~empty]
+            )
+            # Re-seed empty clusters with random sample vectors.
+            sums[empty] = sample[rng.choice(len(sample), empty.sum())]
+            self.centroids = sums / np.maximum(counts, 1)[:, None]
+            if self.distance == 'cosine':
+                self.centroids = self._prep(self.centroids)
+
+        # Inverted lists in CSR format: the ids for cluster c are
+        # order[offsets[c]:offsets[c+1]].
+        labels = self._assign(vecs)
+        self.order = np.argsort(labels, kind='stable')
+        self.offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(labels, minlength=k))]
+        )
+        self.n_clusters = k
+        return self
+
+    def candidates(self, vecs, min_count=1):
+        """Find candidate neighbor ids for each query vector.
+
+        Parameters
+        ----------
+        vecs: np.array
+            Shape (dim,) or (n_queries, dim).
+        min_count: int
+            If the `nprobe` nearest clusters contain fewer than this many
+            vectors, we keep probing clusters until we have enough
+            candidates (usually set to the number of neighbors requested).
+
+        Returns
+        -------
+        list[np.array]: One array of embedding ids per query.
+        """
+        sizes = np.diff(self.offsets)
+        res = []
+        for row in np.argsort(self._centroid_dists(self._prep(vecs)), axis=1):
+            n_probe = max(self.nprobe, np.searchsorted(
+                np.cumsum(sizes[row]), min_count) + 1)
+            res.append(np.concatenate([
+                self.order[self.offsets[c]:self.offsets[c+1]]
+                for c in row[:n_probe]
+            ]))
+        return res
+
+    def __repr__(self):
+        return (f'IVFIndex(n_clusters={self.n_clusters}, '
+                f'nprobe={self.nprobe}, distance={self.distance!r}, '
+                f'recall={self.recall})')
+
+
 # Cell
 class Embeddings:
     """Embeddings object. Lets us easily map word to index, index to
@@ -534,7 +1315,7 @@ class Embeddings:
     name except prefixed with an underscore) allow us to pass in vectors.
     """
 
-    def __init__(self, mat, w2i, pca=None):
+    def __init__(self, mat, w2i, pca=None, index=None, mat_2d=None):
         """
         Parameters
         ----------
@@ -546,8 +1327,16 @@ class Embeddings:
         pca: sklearn.decomposition.PCA or None
             If provided, this should be a PCA object with 2 components that
             was previously fit on `mat`. If None, a new object will be created
-            and fit. This will let us plot embeddings in a way humans can
-            visually parse.
+            and fit the first time we need it (e.g. when calling `vec_2d`).
+            This will let us plot embeddings in a way humans can visually
+            parse.
+        index: IVFIndex or None
+            Optional approximate nearest neighbor index previously fit on
+            `mat` (see `build_index`). When present, neighbor searches use it
+            instead of exact search.
+        mat_2d: np.array or None
+            Optional output of `pca.transform(mat)` (we save this to avoid
+            recomputing it). If None, it's computed lazily.
         """
         self.mat = mat
         max_id = max(w2i.values())
@@ -593,33 +1382,73 @@ class Embeddings:
             )
 
         self.n_embeddings, self.dim = self.mat.shape
-        # Sets "pca" and "mat_2d" attributes.
-        self._validate_or_fit_pca(pca)
+        if pca is not None: check_is_fitted(pca)
+        self._pca = pca
+        self._mat_2d = mat_2d
+        self.index = index
+
+    # Number of embedding rows compared against the query vectors at once
+    # when searching for neighbors. Each chunk produces a distance matrix of
+    # shape (n_queries, search_chunk_size), so lower this if memory is tight.
+    search_chunk_size = 65_536
+    # PCA is fit on a random sample of at most this many rows.
+    pca_sample_size = 100_000
+
+    @property
+    def mat(self):
+        return self._mat
+
+    @mat.setter
+    def mat(self, mat):
+        """Setting a new matrix (e.g. via `normed(inplace=True)`) clears any
+        cached search data and the approximate nearest neighbor index. Note
+        that modifying the matrix in place can't be detected.
+        """
+        if getattr(self, 'index', None) is not None:
+            warnings.warn('Embedding matrix changed so the nearest neighbor '
+                          'index was removed. Call `build_index` to rebuild '
+                          'it.')
+            self.index = None
+        self._mat = mat
+        self._unit_mat = None
+        self._sq_norms = None
+        # PCA must be refit on the new matrix (lazily).
+        self._pca = None
+        self._mat_2d = None
 
-    def _validate_or_fit_pca(self, pca=None):
-        """Compresses embedding matrix using PCA. If an sklearn pca object is
-        passed in, we'll check that it's been fit already. We make this its
-        own method for cases where we perform inplace operations on the
-        embedding matrix (e.g. self.normed) because these require PCA to be
-        refit).
+    @property
+    def pca(self):
+        """PCA object with 2 components used to compress the embedding
+        matrix. This is fit the first time it's accessed (usually via
+        `vec_2d`) using a randomized solver on a random sample of at most
+        `pca_sample_size` rows, so constructing, subsetting, or normalizing
+        Embeddings doesn't do any PCA work.
+        """
+        if self._pca is None:
+            rng = np.random.default_rng(0)
+            rows = slice(None) if self.n_embeddings <= self.pca_sample_size \
+                else np.sort(rng.choice(self.n_embeddings,
+                                        self.pca_sample_size, replace=False))
+            self._pca = PCA(n_components=2, svd_solver='randomized',
+                            random_state=0).fit(self.mat[rows])
+        return self._pca
 
-        Parameters
-        ----------
-        pca: None or sklearn.decomposition.PCA
-            If not None, the object should already be fitted.
+    @property
+    def mat_2d(self):
+        """Embedding matrix compressed to 2 dimensions with `pca`. Computed on
+        first access and cached (`save` persists it too).
         """
-        if pca is None:
-            pca = PCA(n_components=2).fit(self.mat)
-        else:
-            check_is_fitted(pca)
-        self.pca = pca
-        self.mat_2d = self.pca.transform(self.mat)
+        if self._mat_2d is None:
+            self._mat_2d = self.pca.transform(self.mat)
+        return self._mat_2d
 
     @classmethod
-    def from_text_file(cls, path, max_words=float('inf'), print_freq=10_000):
+    def from_text_file(cls, path, max_words=float('inf'), print_freq=None,
+                       dtype=np.float32, n_workers=None, verbose=True):
         """Create a new Embeddings object from a raw text file using the
         GloVe format (each row contains a word and its embedding as
-        space-separated floats).
+        space-separated floats). Word2vec text files (which have an extra
+        header line) work too.
 
         Parameters
         ----------
@@ -628,22 +1457,29 @@ class Embeddings:
         max_words: int, float
             Set maximum number of words to read in from file. This can be used
             during development to reduce wait times when loading data.
+        print_freq: int or None
+            Deprecated and ignored (the file is no longer read line by line).
+            Use `verbose` to show a progress bar instead.
+        dtype: type
+            Dtype of the embedding matrix.
+        n_workers: int or None
+            Number of processes used to parse the file (see
+            `load_text_vectors`).
+        verbose: bool
+            If True, show a progress bar while loading.
 
         Returns
         -------
         Embeddings: Newly instantiated object.
         """
-        w2i = dict()
-        mat = []
-        with open(path, 'r') as f:
-            for i, line in enumerate(f):
-                # Faster testing
-                if i >= max_words: break
-                word, *nums = line.strip().split()
-                w2i[word] = i
-                mat.append(np.array(nums, dtype=float))
-                if i % print_freq == 0: print(i, word)
-        return cls(np.array(mat), w2i)
+        if print_freq is not None:
+            warnings.warn('`print_freq` is deprecated and will be removed in '
+                          'a future version. It\'s currently ignored: use '
+                          '`verbose` to show a progress bar instead.',
+                          DeprecationWarning)
+        words, mat = load_text_vectors(path, max_words, dtype, n_workers,
+                                       verbose=verbose)
+        return cls(mat, {word: i for i, word in enumerate(words)})
 
     @classmethod
     def from_word2vec(cls, w2vec, w2i=None):
@@ -672,25 +1508,78 @@ class Embeddings:
         """
         return cls(**load(path))
 
-    def save(self, path, verbose=True):
+    @classmethod
+    def open(cls, path, mmap=True):
+        """Load embeddings saved with `save(path, binary=True)`. Unlike
+        `from_pickle`, this doesn't deserialize everything or repeat the
+        validation in the constructor: the matrix (and the keys) are
+        memory-mapped by default, so this takes milliseconds and worker
+        processes opening the same files share pages. The word -> index dict
+        is only built the first time it's needed. Pickle files are also
+        accepted and loaded with `from_pickle`.
+
+        Parameters
+        ----------
+        path: str
+            Directory created by `save` (or a pickle file).
+        mmap: bool
+            If True, memory-map the matrix rather than reading it into memory.
+            The mapped matrix is read-only.
+
+        Returns
+        -------
+        Embeddings
+        """
+        if Path(path).is_file(): return cls.from_pickle(path)
+        mat, keys, meta, extras = _load_binary(path, mmap)
+        emb = cls.__new__(cls)
+        emb.mat = mat
+        emb.i2w = keys
+        emb.w2i = _KeyIndex(keys)
+        emb.n_embeddings, emb.dim = mat.shape
+        emb._pca = extras.get('pca')
+        if (Path(path)/'mat_2d.npy').exists():
+            emb._mat_2d = np.load(Path(path)/'mat_2d.npy',
+                                  mmap_mode='r' if mmap else None)
+        emb.index = extras.get('index')
+        return emb
+
+    def save(self, path, verbose=True, binary=False, dtype=None):
         """Save data to a compressed pickle file. This reduces the amount of
         space needed for storage (the csv is much larger) and can let us
-        avoid running PCA and building the embedding matrix again.
+        avoid running PCA and building the embedding matrix again. PCA
+        results are only saved if they've already been computed.
 
         Parameters
         ----------
         path: str
             Path that object will be saved to.
         verbose
+        binary: bool
+            If True, `path` is treated as a directory and we save the data in
+            a binary format (see `_save_binary`) instead of pickling it. Load
+            it with `Embeddings.open`, which can memory-map the matrix.
+        dtype: str or None
+            Only used when binary=True. Lets us store the matrix with a
+            different dtype, e.g. 'float32' or 'float16'.
 
         Returns
         -------
         None
         """
-        # No need to save mat_2d since pca can quickly transform `mat`.
+        if binary:
+            _save_binary(path, self.i2w, self.mat,
+                         extras={'pca': self._pca, 'index': self.index},
+                         dtype=dtype, verbose=verbose)
+            if self._mat_2d is not None:
+                np.save(Path(path)/'mat_2d.npy', self._mat_2d)
+            return
+
         data = dict(mat=self.mat,
                     w2i=self.w2i,
-                    pca=self.pca)
+                    pca=self._pca,
+                    index=self.index,
+                    mat_2d=self._mat_2d)
         save(data, path, verbose=verbose)
 
     def normed(self, inplace=False):
@@ -709,8 +1598,8 @@ class Embeddings:
         """
         normed_mat = self.mat / self.norm(self.mat)[:, None]
         if inplace:
+            # This also resets PCA so it's refit on the new matrix.
             self.mat = normed_mat
-            self._validate_or_fit_pca()
         else:
             return type(self)(normed_mat, self.w2i)
 
@@ -725,9 +1614,10 @@ class Embeddings:
             Top n embeddings (indices 0 through n-1) will be included in
             subset.
         recompute_2d: bool
-            If True, a new 2D matrix will be computed only using the subset,
-            meaning information about the excluded embeddings will be ignored.
-            If False, a subset of the existing embeddings will be used.
+            If True, a new 2D matrix will be computed (lazily) only using the
+            subset, meaning information about the excluded embeddings will be
+            ignored. If False, a subset of the existing 2D embeddings will be
+            used (fitting PCA on the full matrix first if necessary).
 
         Returns
         -------
@@ -737,7 +1627,8 @@ class Embeddings:
             self.mat[:n],
             {k: v for k, v in sorted(self.w2i.items(), key=lambda x: x[1])
              if v < n},
-            pca=None if recompute_2d else self.pca
+            pca=None if recompute_2d else self.pca,
+            mat_2d=None if recompute_2d else self.mat_2d[:n]
         )
 
     @dispatch(str)
@@ -854,6 +1745,71 @@ class Embeddings:
         """
         return self.distance(self.mat, vec, distance=distance)
 
+    def build_index(self, n_clusters=None, nprobe=8, distance='cosine',
+                    verbose=True, **kwargs):
+        """Build an approximate nearest neighbor index (see `IVFIndex`) so
+        that neighbor-based methods (`nearest_neighbors`, `cbow_neighbors`,
+        `semantic_vector`, etc.) are sublinear in the vocabulary size. Recall
+        against exact search is measured on a sample of words afterwards and
+        stored in `self.index.recall`. The index is saved by `save`.
+
+        Parameters
+        ----------
+        n_clusters: int or None
+            See IVFIndex.
+        nprobe: int
+            See IVFIndex. You can tune this later by setting
+            `emb.index.nprobe` and checking `emb.index_recall()`.
+        distance: str
+            One of ('cosine', 'euclidean'). Searches using another distance
+            still use exact search.
+        verbose: bool
+            If True, print the measured recall.
+        kwargs: any
+            Additional kwargs for IVFIndex (n_iter, sample_size, seed).
+
+        Returns
+        -------
+        IVFIndex: The fitted index (also stored as `self.index`).
+        """
+        self.index = IVFIndex(n_clusters, nprobe, distance,
+                              **kwargs).fit(self.mat)
+        self.index.recall = self.index_recall(distance=distance)
+        if verbose: print(self.index)
+        return self.index
+
+    def index_recall(self, n=10, n_queries=200, distance=None, seed=0):
+        """Measure recall@n of the approximate nearest neighbor index: the
+        average fraction of each sampled word's true n nearest neighbors that
+        the index also returns.
+
+        Parameters
+        ----------
+        n: int
+            Number of neighbors to compare.
+        n_queries: int
+            Number of words to sample as queries.
+        distance: str or None
+            Defaults to the distance the index was built with.
+        seed: int
+            Random seed for sampling queries.
+
+        Returns
+        -------
+        float: Recall between 0 and 1.
+        """
+        if self.index is None:
+            raise RuntimeError('No index found. Call `build_index` first.')
+        distance = distance or self.index.distance
+        rng = np.random.default_rng(seed)
+        queries = self.mat[rng.choice(self.n_embeddings,
+                                      min(n_queries, self.n_embeddings),
+                                      replace=False)]
+        exact, _ = self._search(queries, n, distance, exact=True)
+        approx, _ = self._search(queries, n, distance)
+        return float(np.mean([len(set(a) & set(b)) / len(a)
+                              for a, b in zip(exact, approx)]))
+
     def nearest_neighbors(self, word, n=5, distance='cosine', digits=3):
         """Find the most similar words to a given word. This wrapper
         allows the user to pass in a word. To pass in a vector, use
@@ -861,8 +1817,10 @@ class Embeddings:
 
         Parameters
         ----------
-        word: str
-            A word that must be in the vocabulary.
+        word: str or list[str]
+            A word that must be in the vocabulary. You can also pass in a list
+            of words, in which case all their neighbors are found in a single
+            batched search.
         n: int
             Number of neighbors to return.
         distance: str
@@ -873,22 +1831,35 @@ class Embeddings:
 
         Returns
         -------
-        dict[str, float]: Dictionary mapping word to distance.
+        dict[str, float]: Dictionary mapping word to distance. If a list of
+        words was passed in, this is a list of dicts (or None for words that
+        aren't in the vocabulary).
         """
+        if not isinstance(word, str):
+            # Search for all words in a single batch. Missing words get None.
+            present = [w for w in word if w in self]
+            w2neighbors = dict(zip(present, self._nearest_neighbors(
+                self.vec(present), n, distance, digits
+            ))) if present else {}
+            return [w2neighbors.get(w) for w in word]
+
         # Error handling for words not in vocab.
         if word not in self:
             return None
         return self._nearest_neighbors(self.vec(word), n, distance, digits)
 
     def _nearest_neighbors(self, vec, n=5, distance='cosine', digits=3,
-                           skip_first=True):
+                           skip_first=True, exact=False):
         """Find the most similar words to a given word's vector.
         This is the internal function behind `nearest_neighbors`, so you pass
-        in a vector instead of a word.
+        in a vector instead of a word. You can also pass in a 2D array to
+        search for the neighbors of many vectors at once, which is much
+        faster than searching for each one separately.
 
         Parameters
         ----------
         vec: np.array
+            Shape (dim,) or (n_queries, dim).
         n: int
         distance: str
             One of ('cosine', 'euclidean', 'manhattan').
@@ -899,16 +1870,170 @@ class Embeddings:
             to return the word itself). When finding analogies or performing
             embedding arithmetic, however, we likely don't want to slice off
             the first result.
+        exact: bool
+            If True, always use exact search even if we have an approximate
+            nearest neighbor index (see `build_index`).
 
         Returns
         -------
-        dict[str, float]: Dictionary mapping word to distance.
+        dict[str, float] or list[dict[str, float]]: Dictionary mapping word
+        to distance. If `vec` is 2D, we return a list with one dict per row.
         """
-        dists = self._distances(vec, distance)
-        idx = np.argsort(dists)[slice(skip_first, skip_first+n)]
+        vec = np.asarray(vec)
+        idx, dists = self._search(vec, n + skip_first, distance, exact)
         # First convert to float, otherwise we get np.float32 or np.float64
         # scalars which can cause annoying bugs in APIs or dash apps.
-        return {self.i2w[i]: round(float(dists[i]), digits) for i in idx}
+        res = [{self.i2w[i]: round(float(d), digits)
+                for i, d in zip(row_idx[skip_first:], row_dists[skip_first:])}
+               for row_idx, row_dists in zip(idx, dists)]
+        return res if vec.ndim > 1 else res[0]
+
+    def _search(self, vecs, n=5, distance='cosine', exact=False):
+        """Vectorized nearest neighbor search used by all the neighbor-based
+        methods (`nearest_neighbors`, `analogy`, `cbow_neighbors`, etc.).
+        The embedding matrix is processed in chunks of `search_chunk_size`
+        rows: all queries are compared to a chunk with a single matrix
+        multiplication, we keep the top n candidates from each chunk with
+        np.argpartition, and only the final n results are fully sorted.
+
+        Cosine distance uses a cached, pre-normalized float32 copy of the
+        matrix and euclidean distance uses cached squared row norms (both are
+        computed on the first search). Manhattan distance can't be expressed
+        as a matrix multiplication so it's just computed chunk by chunk.
+
+        If we have an approximate nearest neighbor index built with the same
+        distance metric (see `build_index`) and `exact` is False, we only
+        compute distances to the candidates it returns.
+
+        Parameters
+        ----------
+        vecs: np.array
+            Shape (dim,) or (n_queries, dim).
+        n: int
+            Number of neighbors to find for each query.
+        distance: str
+            One of ('cosine', 'euclidean', 'manhattan').
+        exact: bool
+            If True, ignore the approximate nearest neighbor index.
+
+        Returns
+        -------
+        tuple[np.array]: Indices and distances of the nearest neighbors, both
+        with shape (n_queries, n). Each row is sorted from nearest to
+        furthest.
+        """
+        vecs = np.atleast_2d(vecs)
+        n = min(n, self.n_embeddings)
+        if not exact and self.index is not None \
+                and self.index.distance == distance:
+            return self._index_search(vecs, n, distance)
+        chunk_idx, chunk_dists = [], []
+        for start in range(0, self.n_embeddings, self.search_chunk_size):
+            dists = self._chunk_distances(
+                vecs, slice(start, start + self.search_chunk_size), distance
+            )
+            idx = self._top_k(dists, n)
+            chunk_idx.append(idx + start)
+            chunk_dists.append(np.take_along_axis(dists, idx, axis=1))
+        idx = np.concatenate(chunk_idx, axis=1)
+        dists = np.concatenate(chunk_dists, axis=1)
+        top = self._top_k(dists, n)
+        idx = np.take_along_axis(idx, top, axis=1)
+        dists = np.take_along_axis(dists, top, axis=1)
+        order = np.argsort(dists, axis=1)
+        return (np.take_along_axis(idx, order, axis=1),
+                np.take_along_axis(dists, order, axis=1))
+
+    def _index_search(self, vecs, n, distance):
+        """Approximate version of `_search` using `self.index`. Same
+        arguments and return format (vecs must be 2D here).
+        """
+        idx = np.empty((len(vecs), n), dtype=int)
+        dists = np.empty((len(vecs), n))
+        for i, cand in enumerate(self.index.candidates(vecs, n)):
+            cand_dists = self._chunk_distances(vecs[i:i+1], cand, distance)
+            top = self._top_k(cand_dists, n)[0]
+            top = top[np.argsort(cand_dists[0, top])]
+            idx[i] = cand[top]
+            dists[i] = cand_dists[0, top]
+        return idx, dists
+
+    def _chunk_distances(self, vecs, rows, distance='cosine'):
+        """Compute distances from each query vector to a slice of rows of the
+        embedding matrix.
+
+        Parameters
+        ----------
+        vecs: np.array
+            Shape (n_queries, dim).
+        rows: slice or np.array
+            Rows of the embedding matrix to compare to (a slice or an array
+            of row indices).
+        distance: str
+            One of ('cosine', 'euclidean', 'manhattan').
+
+        Returns
+        -------
+        np.array: Shape (n_queries, n_rows).
+        """
+        if distance == 'cosine':
+            if self._unit_mat is None:
+                self._unit_mat = self._unit_rows(self.mat,
+                                                 self.search_chunk_size)
+            return 1 - self._unit_rows(vecs) @ self._unit_mat[rows].T
+        if distance == 'euclidean':
+            if self._sq_norms is None:
+                self._sq_norms = self._row_sq_norms(self.mat,
+                                                    self.search_chunk_size)
+            sq_dists = (self._row_sq_norms(vecs)[:, None]
+                        - 2 * vecs @ self.mat[rows].T
+                        + self._sq_norms[rows])
+            # Rounding errors can cause tiny negative values.
+            return np.sqrt(np.clip(sq_dists, 0, None))
+        if distance == 'manhattan':
+            chunk = self.mat[rows]
+            return np.stack([self.manhattan_distance(chunk, vec)
+                             for vec in vecs])
+        raise ValueError('distance must be one of (\'cosine\', '
+                         '\'euclidean\', \'manhattan\').')
+
+    @staticmethod
+    def _row_sq_norms(mat, chunk_size=None):
+        """Squared L2 norm of each row, computed in float64 `chunk_size` rows
+        at a time so we never make a full-size float64 copy of `mat`.
+        """
+        chunk_size = chunk_size or len(mat) or 1
+        res = np.empty(len(mat), dtype=np.float64)
+        for i in range(0, len(mat), chunk_size):
+            chunk = mat[i:i+chunk_size].astype(np.float64, copy=False)
+            res[i:i+chunk_size] = np.einsum('ij,ij->i', chunk, chunk)
+        return res
+
+    @staticmethod
+    def _unit_rows(mat, chunk_size=None):
+        """Normalize each row to unit L2 norm and convert to float32. All-zero
+        rows are left as zeros (i.e. cosine distance of 1 from everything)
+        rather than becoming nans. Rows are processed `chunk_size` at a time
+        so the only full-size array we allocate is the output.
+        """
+        chunk_size = chunk_size or len(mat) or 1
+        res = np.empty(mat.shape, dtype=np.float32)
+        for i in range(0, len(mat), chunk_size):
+            chunk = res[i:i+chunk_size]
+            chunk[...] = mat[i:i+chunk_size]
+            norms = np.sqrt(np.einsum('ij,ij->i', chunk, chunk))
+            chunk /= np.where(norms == 0, 1, norms)[:, None]
+        return res
+
+    @staticmethod
+    def _top_k(dists, k):
+        """Find the column indices of the k smallest values in each row
+        (unordered). If a row has fewer than k values, all columns are
+        returned.
+        """
+        if k >= dists.shape[1]:
+            return np.broadcast_to(np.arange(dists.shape[1]), dists.shape)
+        return np.argpartition(dists, k - 1, axis=1)[:, :k]
 
     def analogy(self, a, b, c, n=5, **kwargs):
         """Fill in the analogy: A is to B as C is to ___. Note that we always
@@ -1343,7 +2468,7 @@ class Embeddings:
         if not isinstance(obj, Embeddings):
             return False
 
-        ignore = {'pca'}
+        ignore = {'_pca', '_mat_2d', 'index', '_unit_mat', '_sq_norms'}
         for k, v in vars(obj).items():
             if k in ignore: continue
             v_self = getattr(self, k)
@@ -1517,6 +2642,12 @@ class ParaphraseTransform:
             rows = [rows[i*n:(i+1)*n] for i in range(len(text))]
         return rows
 
+    def _is_sampling(self, **kwargs):
+        """Check if outputs are random given a set of __call__ kwargs (used
+        by CachedTransform). Pegasus uses beam search by default.
+        """
+        return bool(kwargs.get('do_sample', False))
+
 
 # Cell
 @auto_repr
@@ -1530,6 +2661,9 @@ class GenerativeTransform:
     """
 
     name = 'text-generation'
+    # Max difference in token count between rows batched together by
+    # `_generate_bucketed`.
+    bucket_width = 8
 
     def __init__(self, n=1, pipe=None):
         """
@@ -1609,10 +2743,90 @@ class GenerativeTransform:
         truncated = ' '.join(tokens)
         return (truncated, n_drop) if return_tuple else truncated
 
+    def _decode(self, prompt, ids):
+        """Convert generated token ids to text the same way the pipeline does
+        (the original prompt followed by the generated continuation).
+        """
+        tok = self.pipe.tokenizer
+        kwargs = dict(skip_special_tokens=True,
+                      clean_up_tokenization_spaces=True)
+        prompt_len = len(tok.decode(tok.encode(prompt,
+                                               add_special_tokens=False),
+                                    **kwargs))
+        return prompt + tok.decode(ids, **kwargs)[prompt_len:]
+
+    def _generate_bucketed(self, texts, n, min_length, max_length,
+                           batch_size, **generate_kwargs):
+        """Tokenize all (already truncated) texts once, sort them by length,
+        and group them into batches of up to `batch_size` rows whose token
+        counts differ by less than `self.bucket_width`. Each batch is left
+        padded to its longest row and passed to `generate` in a single call.
+
+        On older versions of transformers (before `min_new_tokens` and
+        `max_new_tokens` existed), length bounds are relative to the padded
+        length, so shorter rows in a batch may generate up to
+        bucket_width - 1 more tokens than they would on their own.
+
+        Returns
+        -------
+        list[list[str]]: List i contains n generations for texts[i].
+        """
+        tok, model = self.pipe.tokenizer, self.pipe.model
+        ids = tok(texts, add_special_tokens=False)['input_ids']
+        pad_id = generate_kwargs.pop('pad_token_id', None)
+        if pad_id is None:
+            pad_id = tok.eos_token_id if tok.pad_token_id is None \
+                else tok.pad_token_id
+        new_tokens = version.parse(transformers.__version__) \
+            >= version.parse('4.26')
+
+        res = [None] * len(texts)
+        batches = []
+        for i in sorted(range(len(ids)), key=lambda i: len(ids[i])):
+            # The pipeline knows how to handle empty prompts.
+            if not ids[i]:
+                res[i] = [row['generated_text'] for row in self.pipe(
+                    texts[i], min_length=min_length, max_length=max_length,
+                    num_return_sequences=n, pad_token_id=pad_id,
+                    **generate_kwargs
+                )]
+            elif batches and len(batches[-1]) < batch_size and \
+                    len(ids[i]) - len(ids[batches[-1][0]]) < self.bucket_width:
+                batches[-1].append(i)
+            else:
+                batches.append([i])
+
+        for rows in batches:
+            # Rows are sorted so the last one is the longest.
+            length = len(ids[rows[-1]])
+            input_ids = torch.tensor(
+                [[pad_id] * (length - len(ids[i])) + ids[i] for i in rows],
+                device=model.device
+            )
+            attention_mask = torch.tensor(
+                [[0] * (length - len(ids[i])) + [1] * len(ids[i])
+                 for i in rows], device=model.device
+            )
+            length_kwargs = dict(min_new_tokens=min_length,
+                                 max_new_tokens=max_length) if new_tokens \
+                else dict(min_length=length + min_length,
+                          max_length=length + max_length)
+            with torch.no_grad():
+                out = model.generate(
+                    input_ids, attention_mask=attention_mask,
+                    num_return_sequences=n, pad_token_id=pad_id,
+                    **length_kwargs, **generate_kwargs
+                )
+            # Generate returns n consecutive sequences for each input.
+            for j, i in enumerate(rows):
+                res[i] = [self._decode(texts[i], seq)
+                          for seq in out[j*n:(j+1)*n]]
+        return res
+
     @add_docstring(PreTrainedModel.generate)
     def __call__(self, text, n=None, flat=True, min_length=2, max_length=7,
                  drop=None, drop_pct=None, rand_low=None, rand_high=None,
-                 min_keep=3, **generate_kwargs):
+                 min_keep=3, batch_size=None, **generate_kwargs):
         """
         Parameters
         ----------
@@ -1648,6 +2862,14 @@ class GenerativeTransform:
             The minimum number of words to keep. Sequences of this length or
             shorter will therefore remain un-transformed. You could set this
             to zero to enforce no minimum.
+        batch_size: int or None
+            If None (the default), the pipeline is called on one row at a
+            time. If provided, list inputs are instead sorted by token count
+            and passed to the model's generate method directly, up to
+            `batch_size` rows of similar length at a time (see
+            `_generate_bucketed`). This is much faster but bypasses the
+            pipeline's special handling of some models (e.g. XLNet's
+            padding text), so it's opt-in.
         generate_kwargs: any
             Forwarded to model's `generate` method. For convenience, its
             docstring is provided below.
@@ -1658,11 +2880,20 @@ class GenerativeTransform:
         lists, each of length n, if flat=False.
         """
         n = n or self.n
+        if listlike(text) and batch_size:
+            res = self._generate_bucketed(
+                self._preprocess(list(text), drop, drop_pct, rand_low,
+                                 rand_high, min_keep),
+                n, min_length, max_length, batch_size, **generate_kwargs
+            )
+            return flatten(res) if flat else res
+
         if listlike(text):
             res = [self(row, n, flat=flat, min_length=min_length,
                         max_length=max_length, drop=drop, drop_pct=drop_pct,
                         rand_low=rand_low, rand_high=rand_high,
-                        min_keep=min_keep, **generate_kwargs) for row in text]
+                        min_keep=min_keep, batch_size=None,
+                        **generate_kwargs) for row in text]
             return flatten(res) if flat else res
 
         # `generate` counts current length as part of min_length.
@@ -1674,8 +2905,28 @@ class GenerativeTransform:
                         num_return_sequences=n, **generate_kwargs)
         return [row['generated_text'] for row in res]
 
+    def _is_sampling(self, **kwargs):
+        """Check if outputs are random given a set of __call__ kwargs (used
+        by CachedTransform). GPT2's default text generation config samples,
+        so generation is only considered deterministic if the user passes in
+        do_sample=False explicitly.
+        """
+        return bool(kwargs.get('do_sample', True)
+                    or kwargs.get('rand_low') is not None)
+
 
 # Cell
+def _pipe_batch_kwargs(batch_size):
+    """Kwargs to batch list inputs when calling a transformers pipeline.
+    Starting with v4.12, pipelines process list inputs one at a time unless
+    we pass in a batch size, while older versions always batch lists and
+    don't accept the argument.
+    """
+    if version.parse(transformers.__version__) < version.parse('4.12'):
+        return {}
+    return {'batch_size': batch_size}
+
+
 @auto_repr
 class FillMaskTransform:
     """Text transform that masks one or more words in a piece of text and
@@ -1757,9 +3008,37 @@ class FillMaskTransform:
         return ' '.join(self.MASK if i == idx else t
                         for i, t in enumerate(tokens))
 
+    def _fill(self, texts, batch_size):
+        """Fill the masked word in each input text, sending `batch_size` texts
+        to the pipeline at a time.
+
+        Parameters
+        ----------
+        texts: list[str]
+            Each string should contain exactly one mask token.
+        batch_size: int
+
+        Returns
+        -------
+        list[list[str]]: List i contains the self.max_n candidates for
+        texts[i], ordered from most to least likely.
+        """
+        pipe_kwargs = _pipe_batch_kwargs(batch_size)
+        res = []
+        for i in range(0, len(texts), batch_size):
+            batch = texts[i:i+batch_size]
+            seqs = self.pipe(batch, **pipe_kwargs)
+            # Transformers returns either list of dicts or list of list of
+            # dicts depending on whether input list has 1 item or multiple.
+            if not isinstance(seqs[0], list): seqs = [seqs]
+            res.extend([seq['sequence'].replace('<s>', '').replace('</s>', '')
+                        for seq in group] for group in seqs)
+        return res
+
     @add_docstring(PreTrainedModel.generate)
     def __call__(self, text, n=None, flat=True, n_mask=1, min_keep=3,
-                 return_all=False, errors='raise', strategy='best', **kwargs):
+                 return_all=False, errors='raise', strategy='best',
+                 batch_size=32, **kwargs):
         """
         Parameters
         ----------
@@ -1805,6 +3084,11 @@ class FillMaskTransform:
             if you want relatively diverse results. If 'best', the benefit of
             additional iterations is diminished because we are likely to end
             up with very similar (or even identical) results.
+        batch_size: int
+            Number of masked texts to send to the pipeline at once. All rows
+            are masked up front and batched together (rather than processing
+            one row at a time), and each of the n_mask steps is batched
+            across all rows.
         kwargs: any
             Forwarded to model's `generate` method. Its docstring is provided
             below for convenience.
@@ -1821,37 +3105,37 @@ class FillMaskTransform:
         if n > self.max_n:
             self.max_n = n
 
-        # Each item will be a list of strings. Each string in res[i]
-        # will have i words changed. If text is a sequence of strings, we must
-        # handle each one separately because each is passed through pipeline
-        # repeatedly.
-        if listlike(text):
-            res = [self(row, n=n, flat=flat, n_mask=n_mask, min_keep=min_keep,
-                        return_all=return_all, errors=errors,
-                        strategy=strategy, **kwargs) for row in text]
-            return flatten(res) if flat else res
+        if strategy not in ('random', 'best'):
+            raise ValueError('strategy should be "random" or "best".')
 
-        res = [[text]]
+        # res[j] is a list of lists of strings for input row j. Each string
+        # in res[j][i] will have i words changed. Each step masks the latest
+        # samples for every row and fills them all in batches, then regroups
+        # the candidates by row.
+        is_list = listlike(text)
+        res = [[[row]] for row in (text if is_list else [text])]
         for i in range(n_mask):
-            seqs = self.pipe(self._preprocess(res[-1], min_keep=min_keep,
-                                              errors=errors))
-            # Transformers returns either list of dicts or list of list of
-            # dicts depending on whether input list has 1 item or multiple.
-            if isinstance(seqs[0], list):
-                seqs = [seq for group in seqs for seq in group]
-            text = [seq['sequence'].replace('<s>', '').replace('</s>', '')
-                    for seq in seqs]
-
-            # Keep all generated samples when n is -1.
-            if n != -1:
-                if strategy == 'random':
-                    text = np.random.choice(text, n, replace=False)
-                elif strategy == 'best':
-                    text = text[:n]
-                else:
-                    raise ValueError('strategy should be "random" or "best".')
-            res.append(text)
-        if not return_all: res = res[n_mask]
+            masked = [self._preprocess(row_res[-1], min_keep=min_keep,
+                                       errors=errors) for row_res in res]
+            filled = self._fill([t for group in masked for t in group],
+                                batch_size)
+            start = 0
+            for row_res, group in zip(res, masked):
+                text = [seq for seqs in filled[start:start + len(group)]
+                        for seq in seqs]
+                start += len(group)
+
+                # Keep all generated samples when n is -1.
+                if n != -1:
+                    if strategy == 'random':
+                        text = np.random.choice(text, n, replace=False)
+                    else:
+                        text = text[:n]
+                row_res.append(text)
+
+        if not return_all: res = [row_res[n_mask] for row_res in res]
+        res = [flatten(row_res) if flat else row_res for row_res in res]
+        if not is_list: return res[0]
         return flatten(res) if flat else res
 
     @property
@@ -1868,6 +3152,12 @@ class FillMaskTransform:
             raise ValueError(f'max_n must be >= self.n (currently {self.n}.')
         self.pipe.topk = max_n
 
+    def _is_sampling(self, **kwargs):
+        """Check if outputs are random given a set of __call__ kwargs (used
+        by CachedTransform). The masked word is always chosen randomly.
+        """
+        return True
+
 
 # Cell
 NLP_TRANSFORMS = {
@@ -1886,6 +3176,11 @@ class BacktranslateTransform:
     little different from the other transforms: it has 2 pipelines, not 1, so
     has variables `names` and `pipes` (both lists) instead of `name` and
     `pipe`. It also has no `_preprocess` method.
+
+    Inputs are deduplicated before translation and sent to the pipelines in
+    batches. By default, the two translation stages also overlap: the
+    backtranslation of batch k runs in a background thread while batch k+1
+    is being translated to the target language.
     """
 
     names = ['Helsinki-NLP/opus-mt-en-ROMANCE',
@@ -1941,7 +3236,7 @@ class BacktranslateTransform:
         'mwl': 'mirandese'
     }
 
-    def __init__(self, to_langs, pipes=()):
+    def __init__(self, to_langs, pipes=(), batch_size=32, overlap=True):
         """
         Parameters
         ----------
@@ -1958,18 +3253,72 @@ class BacktranslateTransform:
             Romance languages and the second of which does the reverse. It's
             usually easiest to let the Transform create these for you, but if
             you already have them passing them in will be faster.
+        batch_size: int
+            Default number of unique texts to translate at once. You can
+            override this in specific calls.
+        overlap: bool
+            Default for whether to overlap the forward and backward
+            translation stages (see class docstring). You can override this
+            in specific calls.
         """
         if not pipes:
             pipes = [TranslationPipeline(
                         model=AutoModelForSeq2SeqLM.from_pretrained(name),
                         tokenizer=AutoTokenizer.from_pretrained(name),
-                        device=1 - torch.cuda.is_available()
-                     ) for name in names]
+                        device=0 if torch.cuda.is_available() else -1
+                     ) for name in self.names]
         self.pipes = pipes
         self.to_langs = tolist(to_langs)
+        self.batch_size = batch_size
+        self.overlap = overlap
+
+    def _translate(self, pipe, texts, batch_size):
+        return [row['translation_text']
+                for row in pipe(texts, **_pipe_batch_kwargs(batch_size))]
+
+    def _backtranslate(self, texts, langs, batch_size, overlap):
+        """Backtranslate each text through its corresponding language. Only
+        unique (text, language) pairs are translated and results are
+        scattered back to the original positions.
+
+        Parameters
+        ----------
+        texts: list[str]
+        langs: list[str]
+            Same length as texts. Rows with different languages can be
+            translated in the same batch.
+        batch_size: int
+        overlap: bool
+            If True, backtranslate batch k in a background thread while batch
+            k+1 is translated to the target language.
+
+        Returns
+        -------
+        list[str]: Item i is the backtranslation of texts[i] via langs[i].
+        """
+        pairs = list(dict.fromkeys(zip(texts, langs)))
+        batches = [[f'>>{lang}<< {text}' for text, lang in
+                    pairs[i:i+batch_size]]
+                   for i in range(0, len(pairs), batch_size)]
+        res = []
+        if overlap and len(batches) > 1:
+            with ThreadPoolExecutor(1) as executor:
+                pending = None
+                for batch in batches:
+                    batch = self._translate(self.pipes[0], batch, batch_size)
+                    if pending: res.extend(pending.result())
+                    pending = executor.submit(self._translate, self.pipes[1],
+                                              batch, batch_size)
+                res.extend(pending.result())
+        else:
+            for batch in batches:
+                batch = self._translate(self.pipes[0], batch, batch_size)
+                res.extend(self._translate(self.pipes[1], batch, batch_size))
+        pair2res = dict(zip(pairs, res))
+        return [pair2res[pair] for pair in zip(texts, langs)]
 
     def __call__(self, text, intermediate=False, flat=True, to_langs=(),
-                 **kwargs):
+                 chain=True, batch_size=None, overlap=None, **kwargs):
         """
         Parameters
         ----------
@@ -1990,6 +3339,20 @@ class BacktranslateTransform:
             translate input from
             english -> spanish -> english -> french -> english. If not
             specified, this defaults to self.to_langs.
+        chain: bool
+            If True, languages are applied in order as described above, so
+            each language must wait for the previous one to finish. If False,
+            each language backtranslates the original text independently and
+            all languages are handled in a single batched pass. Every
+            language's output is then a final result, so we return
+            len(to_langs) backtranslations per input (like
+            intermediate=True).
+        batch_size: int or None
+            Number of unique texts to translate at once. Defaults to
+            self.batch_size.
+        overlap: bool or None
+            Whether to overlap the forward and backward translation stages.
+            Defaults to self.overlap.
         kwargs: any
             Ignored. Just provided for consistency with other transforms.
 
@@ -2004,13 +3367,25 @@ class BacktranslateTransform:
         to_langs = tolist(to_langs) or self.to_langs
         assert not set(to_langs) - set(self.language_codes), \
             'to_langs codes should all be present in self.language_codes.'
+        batch_size = batch_size or self.batch_size
+        overlap = ifnone(overlap, self.overlap)
+
+        if chain:
+            steps = []
+            for lang in to_langs:
+                text = self._backtranslate(text, [lang] * len(text),
+                                           batch_size, overlap)
+                steps.append(text)
+        else:
+            res = self._backtranslate(
+                [t for _ in to_langs for t in text],
+                [lang for lang in to_langs for _ in text],
+                batch_size, overlap
+            )
+            steps = [res[i*len(text):(i+1)*len(text)]
+                     for i in range(len(to_langs))]
+            intermediate = True
 
-        steps = []
-        for lang in to_langs:
-            text = [f'>>{lang}<< {t}' for t in text]
-            text = [row['translation_text'] for row in self.pipes[0](text)]
-            text = [row['translation_text'] for row in self.pipes[1](text)]
-            steps.append(text)
         if intermediate:
             steps = zip(*steps)
             return flatten(steps) if flat else lmap(list, *steps)
@@ -2021,12 +3396,417 @@ class BacktranslateTransform:
         lang_str = ", ".join(repr(lang) for lang in self.to_langs)
         return f'{func_name(self)}(to_langs=[{lang_str}])'
 
+    def _is_sampling(self, **kwargs):
+        """Check if outputs are random given a set of __call__ kwargs (used
+        by CachedTransform). Translation uses the pipelines' default beam
+        search and generation kwargs are ignored, so this is deterministic.
+        """
+        return False
+
 
 # Cell
+class AugmentationCache:
+    """Persistent on-disk cache of augmented text, backed by SQLite. Entries
+    are content-addressed: the key is a hash of the transform config (model
+    name and call kwargs) plus a hash of the input text, and the value is the
+    list of outputs generated for that text. You usually won't need to
+    interact with this directly - see `CachedTransform`.
+    """
+
+    # SQLite limits the number of variables in a single query.
+    query_chunk_size = 500
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path: str or Path
+            SQLite database file. Directories will be created as needed.
+        """
+        self.path = Path(path)
+        os.makedirs(self.path.parent, exist_ok=True)
+        self._conn = None
+
+    @property
+    def conn(self):
+        # Connect lazily so the cache can be pickled and sent to other
+        # processes (each gets its own connection).
+        if self._conn is None:
+            # Multiple worker processes may write to the same cache.
+            self._conn = sqlite3.connect(str(self.path), timeout=60)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS augmentations ('
+                'config TEXT, text_hash TEXT, outputs TEXT, '
+                'PRIMARY KEY (config, text_hash))'
+            )
+        return self._conn
+
+    @staticmethod
+    def hash_text(text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def hash_config(config):
+        """config: dict[str, any] (must be json serializable)."""
+        return hashlib.sha1(json.dumps(config, sort_keys=True, default=str)
+                            .encode('utf-8')).hexdigest()
+
+    def get_many(self, config_hash, text_hashes):
+        """Bulk lookup.
+
+        Parameters
+        ----------
+        config_hash: str
+            See `hash_config`.
+        text_hashes: Iterable[str]
+            See `hash_text`.
+
+        Returns
+        -------
+        dict[str, list]: Maps text hash to cached outputs. Misses are
+        excluded.
+        """
+        text_hashes = list(set(text_hashes))
+        res = {}
+        for i in range(0, len(text_hashes), self.query_chunk_size):
+            chunk = text_hashes[i:i+self.query_chunk_size]
+            rows = self.conn.execute(
+                'SELECT text_hash, outputs FROM augmentations WHERE '
+                f'config = ? AND text_hash IN ({",".join("?" * len(chunk))})',
+                [config_hash, *chunk]
+            )
+            res.update((k, json.loads(v)) for k, v in rows)
+        return res
+
+    def put_many(self, config_hash, hash2outputs):
+        """Bulk insert (existing entries are overwritten).
+
+        Parameters
+        ----------
+        config_hash: str
+            See `hash_config`.
+        hash2outputs: dict[str, list]
+            Maps text hash to the outputs generated for that text.
+        """
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO augmentations VALUES (?, ?, ?)',
+                [(config_hash, k, json.dumps(v, default=np.ndarray.tolist))
+                 for k, v in hash2outputs.items()]
+            )
+
+    def __len__(self):
+        return self.conn.execute(
+            'SELECT COUNT(*) FROM augmentations'
+        ).fetchone()[0]
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute('DELETE FROM augmentations')
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __getstate__(self):
+        return {**self.__dict__, '_conn': None}
+
+    def __repr__(self):
+        return f'{type(self).__name__}(path={str(self.path)!r})'
+
+
+# Cell
+class CachedTransform:
+    """Wraps one of our NLP transforms so augmented text is read from an
+    AugmentationCache when possible. Each call looks up all inputs in bulk and
+    only sends misses (deduplicated) to the underlying transform.
+
+    Deterministic settings (e.g. ParaphraseTransform and
+    BacktranslateTransform with their default beam search) are cached by
+    default. Settings that sample (FillMaskTransform, which always masks a
+    random word, or do_sample=True) would silently return the same "random"
+    outputs every time, so they're only cached if you opt in by passing in a
+    seed, which becomes part of the cache key.
+
+    Call kwargs in `ignore_kwargs` only affect speed, not outputs, so they're
+    excluded from the cache key.
+
+    Examples
+    --------
+    tfm = CachedTransform(ParaphraseTransform(n=3), 'data/aug_cache.db')
+    tfm(texts)
+    """
+
+    ignore_kwargs = ('batch_size', 'overlap')
+
+    def __init__(self, transform, cache, seed=None):
+        """
+        Parameters
+        ----------
+        transform: callable
+            One of the transforms in this module (an object, not a class).
+        cache: str, Path, or AugmentationCache
+            If str or Path, this is the location of the SQLite database.
+        seed: int or None
+            Required to cache transforms/settings that sample. Random seeds
+            are set using this before generating outputs for cache misses.
+        """
+        self.transform = transform
+        self.cache = cache if isinstance(cache, AugmentationCache) \
+            else AugmentationCache(cache)
+        self.seed = seed
+        self.name = self._model_name(transform)
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def _model_name(transform):
+        """Get the name or path of the model(s) actually loaded by the
+        transform. `transform.name` isn't enough since it may just be a task
+        name when a default pipeline is used.
+        """
+        if hasattr(transform, 'pipe'):
+            return transform.pipe.model.config._name_or_path
+        if hasattr(transform, 'pipes'):
+            return [pipe.model.config._name_or_path
+                    for pipe in transform.pipes]
+        return getattr(transform, 'name', None) or \
+            getattr(transform, 'names', None)
+
+    def _config(self, kwargs):
+        """Everything that affects the output for a given input text."""
+        kwargs = {k: v for k, v in kwargs.items()
+                  if k not in self.ignore_kwargs}
+        config = {'transform': func_name(self.transform), 'model': self.name,
+                  'seed': self.seed, **kwargs}
+        for attr in ('n', 'to_langs'):
+            if config.get(attr) is None and hasattr(self.transform, attr):
+                config[attr] = getattr(self.transform, attr)
+        return config
+
+    def __call__(self, text, flat=True, **kwargs):
+        """
+        Parameters
+        ----------
+        text: str or Iterable[str]
+            Raw text to transform.
+        flat: bool
+            Same as the underlying transform.
+        kwargs: any
+            Passed to the underlying transform (these are also part of the
+            cache key, aside from `ignore_kwargs`).
+
+        Returns
+        -------
+        list: Same format as the underlying transform.
+        """
+        if self.transform._is_sampling(**kwargs) and self.seed is None:
+            raise ValueError(
+                f'{func_name(self.transform)} samples outputs with these '
+                'settings so results would be identical across runs if '
+                'cached. Pass a `seed` to CachedTransform to opt in.'
+            )
+
+        is_list = listlike(text)
+        texts = list(text) if is_list else [text]
+        config_hash = self.cache.hash_config(self._config(kwargs))
+        hashes = [self.cache.hash_text(t) for t in texts]
+        hash2res = self.cache.get_many(config_hash, hashes)
+
+        # Only unique misses are sent to the transform.
+        hash2text = {h: t for h, t in zip(hashes, texts) if h not in hash2res}
+        n_misses = sum(h in hash2text for h in hashes)
+        self.hits += len(texts) - n_misses
+        self.misses += n_misses
+        if hash2text:
+            if self.seed is not None: reproducible(self.seed, verbose=False)
+            new = self.transform(list(hash2text.values()), flat=False,
+                                 **kwargs)
+            new = dict(zip(hash2text, new))
+            self.cache.put_many(config_hash, new)
+            hash2res.update(new)
+
+        res = [hash2res[h] for h in hashes]
+        if not is_list: return flatten(res) if flat else res[0]
+        return flatten(res) if flat else res
+
+    def __repr__(self):
+        return f'{func_name(self)}(transform={self.transform!r}, ' \
+               f'cache={self.cache!r}, seed={self.seed})'
+
+
+# Cell
+def _augment_df(df, transform, text_col, id_cols, batch_size, call_kwargs):
+    """Generate augmented text for a single dataframe (or chunk of one),
+    calling the transform on at most `batch_size` rows at a time.
+    """
+    texts = df[text_col].tolist()
+    batch_size = batch_size or max(len(texts), 1)
+    res = []
+    for i in range(0, len(texts), batch_size):
+        res.extend(transform(texts[i:i+batch_size],
+                             **{**call_kwargs, 'flat': True}))
+    res = pd.DataFrame(res, columns=[text_col])
+
+    # Attach identifier columns to output (e.g. we usually want to store
+    # labels and or sample IDs. Most of our augmentation methods make
+    # relatively minor changes to the input so all variations of 1 input
+    # should remain in the same set, usually training.).
+    if id_cols:
+        df_id = pd.concat([df[col].repeat(res.shape[0] // df.shape[0])
+                           for col in id_cols], axis=1).reset_index(drop=True)
+        res = pd.concat([df_id, res], axis=1)
+    return res
+
+
+def _transform_key(transform):
+    """Get the NLP_TRANSFORMS key for a transform name or object so resumed
+    jobs are recognized regardless of how the transform was passed in.
+    Objects that aren't in the registry fall back to their class name.
+    """
+    if isinstance(transform, str): return transform
+    if isinstance(transform, CachedTransform): transform = transform.transform
+    for k, v in NLP_TRANSFORMS.items():
+        if type(transform) is v: return k
+    return func_name(transform)
+
+
+_worker_transform = None
+
+
+def _init_augment_worker(transform, tfm_kwargs, cache=None, seed=None,
+                         n_threads=None):
+    """Load the transform once per worker process."""
+    global _worker_transform
+    if n_threads:
+        # Avoid oversubscribing cores when each process would otherwise use
+        # all of them. BLAS/OpenMP libraries are already loaded by the time a
+        # forked worker starts so env vars like OMP_NUM_THREADS would have no
+        # effect here - we have to limit the thread pools at runtime.
+        threadpool_limits(n_threads)
+        torch.set_num_threads(n_threads)
+    _worker_transform = NLP_TRANSFORMS[transform](**tfm_kwargs)
+    if cache:
+        _worker_transform = CachedTransform(_worker_transform, cache, seed)
+
+
+def _augment_chunk(df, text_col, id_cols, batch_size, call_kwargs,
+                   transform=None):
+    """Returns the augmented df and the number of seconds it took."""
+    start = time.perf_counter()
+    res = _augment_df(df, transform or _worker_transform, text_col, id_cols,
+                      batch_size, call_kwargs)
+    return res, time.perf_counter() - start
+
+
+def _augment_chunks(chunks, transform, text_col, id_cols, batch_size,
+                    call_kwargs, n_workers=1, worker_args=(),
+                    max_pending=None):
+    """Augment an iterable of dataframes, yielding (augmented df, seconds)
+    tuples in the same order as the inputs. When n_workers > 1, chunks are
+    pulled from a shared queue by worker processes and `worker_args` are
+    passed to `_init_augment_worker` (so `transform` should be a key in
+    NLP_TRANSFORMS rather than an object). We only keep `max_pending` chunks
+    in flight so the source doesn't need to fit in memory.
+    """
+    if n_workers == 1:
+        for chunk in chunks:
+            yield _augment_chunk(chunk, text_col, id_cols, batch_size,
+                                 call_kwargs, transform)
+        return
+
+    max_pending = max_pending or 2 * n_workers
+    pool = multiprocessing.Pool(n_workers, _init_augment_worker,
+                                (transform, *worker_args))
+    pending = deque()
+    try:
+        for chunk in chunks:
+            pending.append(pool.apply_async(
+                _augment_chunk,
+                (chunk, text_col, id_cols, batch_size, call_kwargs)
+            ))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _write_atomic(path, write_fn):
+    """Write to a temporary file and then rename it so a crash never leaves
+    a partially written file at `path`.
+    """
+    tmp = path.parent/(path.name + '.tmp')
+    write_fn(tmp)
+    os.replace(tmp, path)
+
+
+def _augment_shards(chunks, process, dest, fmt, config, verbose):
+    """Streaming mode of `augment_text_df`: write each chunk's output to its
+    own shard file and record it in a manifest so completed shards can be
+    skipped if the job is restarted. `process` maps an iterable of chunks to
+    (augmented df, seconds) tuples in order (see `_augment_chunks`).
+
+    Returns
+    -------
+    tuple[list[Path], int]: Paths of all shards and the number of source rows
+    processed in this call (i.e. excluding skipped shards).
+    """
+    os.makedirs(dest, exist_ok=True)
+    manifest_path = dest/'manifest.json'
+    if manifest_path.exists():
+        manifest = load(manifest_path, verbose=False)
+        if manifest['config'] != config:
+            raise ValueError(
+                f'{dest} contains shards created with different settings '
+                f'({manifest["config"]}). Use a new `dest` or delete it to '
+                'start over.'
+            )
+    else:
+        manifest = {'config': config, 'shards': {}}
+
+    # Results come back in order, so we just need to remember which shards
+    # the pending chunks belong to.
+    paths = []
+    todo = deque()
+
+    def incomplete():
+        for i, chunk in enumerate(chunks):
+            name = f'part-{i:05}.{fmt}'
+            paths.append(dest/name)
+            if name in manifest['shards'] and paths[-1].exists():
+                if verbose: print(f'Skipping completed shard {name}.')
+                continue
+            todo.append((name, len(chunk)))
+            yield chunk
+
+    n_rows = 0
+    for res, secs in process(incomplete()):
+        name, rows_in = todo.popleft()
+        _write_atomic(dest/name, partial(getattr(res, f'to_{fmt}'),
+                                         index=False))
+        manifest['shards'][name] = {'rows_in': rows_in,
+                                    'rows_out': len(res),
+                                    'seconds': round(secs, 3)}
+        _write_atomic(manifest_path, lambda path: path.write_text(
+            json.dumps(manifest, indent=2)))
+        n_rows += rows_in
+        if verbose:
+            print(f'Wrote shard {name}: {rows_in:,} rows in {secs:.1f}s '
+                  f'({rows_in / secs:.2f} rows/sec).')
+    return paths, n_rows
+
+
 @immutify_defaults
+@valuecheck
 def augment_text_df(source, transform='fillmask', dest=None, n=5,
                     text_col='text', id_cols=(), nrows=None, tfm_kwargs={},
-                    call_kwargs={}):
+                    call_kwargs={}, chunksize=None, batch_size=None,
+                    fmt:('csv', 'parquet')='csv', cache=None, seed=None,
+                    n_workers=1, n_threads=None, verbose=True):
     """Create augmented versions of a dataframe of text, optionally preserving
     other columns for identification purposes. We recommend precomputing and
     saving variations of your data rather than doing this on the fly in a
@@ -2036,6 +3816,17 @@ def augment_text_df(source, transform='fillmask', dest=None, n=5,
     make relatively limited changes to the raw text (just enough to provide a
     regularizing effect).
 
+    If `chunksize` is provided, we use a streaming mode that's better suited
+    to long jobs: the source is read `chunksize` rows at a time and each
+    chunk's output is saved as its own shard in the `dest` directory
+    (part-00000.csv, part-00001.csv, etc.) along with a manifest.json file
+    recording completed shards and their throughput. If the job crashes, just
+    rerun the same command and completed shards will be skipped.
+
+    If `n_workers` > 1, chunks of rows are pulled from a shared queue by
+    worker processes, each of which loads its own copy of the transform
+    once, and results are merged back in the original order.
+
     Parameters
     ----------
     source: str, Path, or pd.DataFrame
@@ -2054,7 +3845,8 @@ def augment_text_df(source, transform='fillmask', dest=None, n=5,
         If str or Path, this is where the output file will be saved to
         (directories will be created as needed). If None, nothing will be
         saved and the function will merely return the output DF for you to do
-        with as you wish.
+        with as you wish. In streaming mode (see `chunksize`), this is the
+        directory to write shards to and it's required.
     n: int
         Number of samples to generate for each raw row.
     text_col: str
@@ -2073,19 +3865,56 @@ def augment_text_df(source, transform='fillmask', dest=None, n=5,
     call_kwargs: dict
         Arguments to pass to the __call__ method of `transform` to affect
         the augmentation process.
+    chunksize: int or None
+        If provided, enables streaming mode (see above) with this many source
+        rows per shard. When resuming a job, this must be the same as before
+        so shards line up with the same source rows.
+    batch_size: int or None
+        Max number of source rows to pass to `transform` in a single call.
+        None means all rows (or all rows in the chunk in streaming mode).
+    fmt: str
+        Output format for shards in streaming mode: 'csv' or 'parquet'
+        (parquet requires pyarrow or fastparquet).
+    cache: str, Path, AugmentationCache, or None
+        If provided, wrap the transform in a CachedTransform so outputs for
+        previously seen texts (with the same transform settings) are read
+        from this SQLite cache instead of being regenerated.
+    seed: int or None
+        Passed to CachedTransform. Required to cache transforms that sample
+        (e.g. fillmask).
+    n_workers: int
+        Number of processes to use. If > 1, `transform` must be a str (each
+        worker creates its own transform object) and rows are sent to
+        workers `chunksize` rows at a time in streaming mode or `batch_size`
+        rows at a time otherwise (if batch_size is None, we split the rows
+        into 4 chunks per worker).
+    n_threads: int or None
+        Number of threads each worker should use for torch/BLAS operations.
+        Defaults to splitting the available cores evenly across workers.
+        Ignored when n_workers is 1.
+    verbose: bool
+        If True, print overall throughput, as well as throughput for each
+        shard in streaming mode.
 
     Returns
     -------
-    pd.DataFrame: DF of generated text with columns `text_col` and `id_cols`.
-    By default, this will have 5x the rows as your source DF, but this can
-    easily be adjusted through the `nrows` parameter.
+    pd.DataFrame or list[Path]: DF of generated text with columns `text_col`
+    and `id_cols`. By default, this will have 5x the rows as your source DF,
+    but this can easily be adjusted through the `nrows` parameter. In
+    streaming mode, we return the paths of the shard files instead.
     """
     # Load data.
+    usecols = [text_col] + list(id_cols)
     if isinstance(source, (str, Path)):
-        df = pd.read_csv(Path(source), usecols=[text_col] + list(id_cols),
-                         nrows=nrows)
+        df = pd.read_csv(Path(source), usecols=usecols, nrows=nrows,
+                         chunksize=chunksize)
     elif isinstance(source, pd.DataFrame):
         df = source.head(nrows)
+        if chunksize:
+            # Must be a list rather than a generator: a lazy generator would
+            # look up `df` after it's been rebound to the generator itself.
+            df = [df.iloc[i:i+chunksize]
+                  for i in range(0, len(df), chunksize)]
     else:
         raise TypeError('`source` must be a str/Path or pd.DataFrame.')
 
@@ -2093,29 +3922,62 @@ def augment_text_df(source, transform='fillmask', dest=None, n=5,
     if isinstance(dest, (str, Path)):
         dest = Path(dest)
         os.makedirs(dest.parent, exist_ok=True)
-    elif dest is not None:
+    elif dest is not None or chunksize:
         raise ValueError('`dest` must be a str/Path containing the output '
                          'file name to create, or None if you just want to '
-                         'return a df.')
+                         'return a df. Streaming mode requires a `dest` '
+                         'directory.')
 
     # For simplicity, we stick to one transform at a time. Slow to load so at
     # least for now, let user pass in the transform itself.
-    transform = NLP_TRANSFORMS[transform](n=n, **tfm_kwargs) \
-        if isinstance(transform, str) else transform
-
-    # Generate new variations of input text.
-    res = transform(df[text_col].tolist(), **{**call_kwargs, 'flat': True})
-    res = pd.DataFrame(res, columns=[text_col])
-
-    # Attach identifier columns to output (e.g. we usually want to store
-    # labels and or sample IDs. Most of our augmentation methods make
-    # relatively minor changes to the input so all variations of 1 input
-    # should remain in the same set, usually training.).
-    if id_cols:
-        df_id = pd.concat([df[col].repeat(res.shape[0] // df.shape[0])
-                           for col in id_cols], axis=1).reset_index(drop=True)
-        res = pd.concat([df_id, res], axis=1)
-
-    # Optionally save output.
-    if dest: res.to_csv(dest, index=False)
+    transform_name = _transform_key(transform)
+    from_name = isinstance(transform, str)
+    worker_args = ()
+    if n_workers > 1:
+        if not isinstance(transform, str):
+            raise ValueError('`transform` must be a str when n_workers > 1 '
+                             'so each worker can load its own copy.')
+        n_threads = n_threads or max(os.cpu_count() // n_workers, 1)
+        worker_args = ({'n': n, **tfm_kwargs}, cache, seed, n_threads)
+    elif isinstance(transform, str):
+        transform = NLP_TRANSFORMS[transform](n=n, **tfm_kwargs)
+    if cache and n_workers == 1:
+        transform = CachedTransform(transform, cache, seed)
+    process = partial(_augment_chunks, transform=transform,
+                      text_col=text_col, id_cols=id_cols,
+                      batch_size=batch_size, call_kwargs=call_kwargs,
+                      n_workers=n_workers, worker_args=worker_args)
+
+    start = time.perf_counter()
+    if chunksize:
+        # Anything that affects outputs, in its json form so it can be
+        # compared to the manifest of a previous run.
+        config = {
+            'transform': transform_name, 'n': n, 'text_col': text_col,
+            'id_cols': list(id_cols), 'nrows': nrows,
+            'chunksize': chunksize, 'fmt': fmt,
+            # Constructor kwargs are ignored for transform objects.
+            'tfm_kwargs': tfm_kwargs if from_name else {},
+            'call_kwargs': {k: v for k, v in call_kwargs.items()
+                            if k not in CachedTransform.ignore_kwargs}
+        }
+        config = json.loads(json.dumps(config, default=str))
+        res, n_rows = _augment_shards(df, process, dest, fmt, config,
+                                      verbose)
+    else:
+        # Generate new variations of input text.
+        size = batch_size or -(-len(df) // (4 * n_workers)) or 1
+        chunks = [df] if n_workers == 1 else \
+            [df.iloc[i:i+size] for i in range(0, len(df), size)] or [df]
+        res = pd.concat([chunk for chunk, _ in process(chunks)],
+                        ignore_index=True)
+        n_rows = len(df)
+
+        # Optionally save output.
+        if dest: res.to_csv(dest, index=False)
+
+    secs = time.perf_counter() - start
+    if verbose:
+        print(f'Augmented {n_rows:,} rows in {secs:.1f}s '
+              f'({n_rows / max(secs, 1e-9):.2f} rows/sec).')
     return res
\ No newline at end of file